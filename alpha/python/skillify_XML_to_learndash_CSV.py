@@ -11,17 +11,18 @@ def get_directory():
         sys.exit(1)
     return directory
 
-def initialize_csv_files(directory):
-    csv_files = {
-        'Course': ['Path', 'CourseID', 'Course_RN', 'Course_CourseSummary', 'Course_Video', 'Course_Image', 'Course_Duration', 'Course_CategoryName', 'Course_Level', 'Course_Language', 'Course_Price', 'Course_ProductId', 'Course_CourseName', 'Course_CourseId'],
-        'Expert': ['Path', 'CourseID', 'ExpertID', 'Expert_FirstName', 'Expert_LastName', 'Expert_Title', 'Expert_Bio'],
-        'Section': ['Path', 'CourseID', 'SectionID', 'Lesson_Id', 'Lesson_Name', 'Lesson_DisplayOrder'],
-        'Lesson': ['Path', 'CourseID', 'SectionID', 'LessonID', 'Section_Id', 'Section_Type', 'Section_ContentType', 'Section_Name', 'Section_Pass', 'Section_Take', 'Section_HasBookmark', 'Section_DisplayOrder'],
-        'Topic': ['Path', 'CourseID', 'SectionID', 'LessonID', 'TopicID', 'DownloadID', 'VideoElementHtml', 'Content_Id', 'Content_Type', 'Content_ContentType', 'Content_Name', 'Content_Take', 'Content_HasBookmark', 'Content_DisplayOrder', 'Content_Url', 'Content_Guid', 'Content_Time', 'Content_Pass', 'File_Id', 'File_Name', 'File_Description', 'File_Questions', 'File_Time', 'File_Url', 'File_DisplayOrder', 'File_Guid', 'File_ViewGradebook', 'File_Points', 'File_Pages', 'File_SizeKb', 'Settings_EnableRetakes', 'Settings_ForcePassTest', 'Settings_TakeInOrder', 'Settings_SaveAndResume', 'Settings_Resumes', 'Settings_IsTimed', 'Settings_DefaultTime', 'Settings_ShowFeedback', 'Settings_ShowAnswers', 'Settings_AllowRetakes', 'Settings_Retakes', 'Settings_ShowStudyGuide', 'Settings_IsPooling', 'Settings_PoolSize', 'Settings_IsProctored', 'Settings_UseAnyProctor', 'Settings_ProctorId', 'Settings_IsFullScreen', 'Download_Id', 'Download_Name', 'Download_Title', 'Download_Url', 'Download_SizeKb', 'Track_MediaId', 'Track_Label', 'Track_Name', 'Track_Url']
-    }
+# Fixed column sets of the five CSV files
+CSV_HEADERS = {
+    'Course': ['Path', 'CourseID', 'Course_RN', 'Course_CourseSummary', 'Course_Video', 'Course_Image', 'Course_Duration', 'Course_CategoryName', 'Course_Level', 'Course_Language', 'Course_Price', 'Course_ProductId', 'Course_CourseName', 'Course_CourseId'],
+    'Expert': ['Path', 'CourseID', 'ExpertID', 'Expert_FirstName', 'Expert_LastName', 'Expert_Title', 'Expert_Bio'],
+    'Section': ['Path', 'CourseID', 'SectionID', 'Lesson_Id', 'Lesson_Name', 'Lesson_DisplayOrder'],
+    'Lesson': ['Path', 'CourseID', 'SectionID', 'LessonID', 'Section_Id', 'Section_Type', 'Section_ContentType', 'Section_Name', 'Section_Pass', 'Section_Take', 'Section_HasBookmark', 'Section_DisplayOrder'],
+    'Topic': ['Path', 'CourseID', 'SectionID', 'LessonID', 'TopicID', 'DownloadID', 'VideoElementHtml', 'Content_Id', 'Content_Type', 'Content_ContentType', 'Content_Name', 'Content_Take', 'Content_HasBookmark', 'Content_DisplayOrder', 'Content_Url', 'Content_Guid', 'Content_Time', 'Content_Pass', 'File_Id', 'File_Name', 'File_Description', 'File_Questions', 'File_Time', 'File_Url', 'File_DisplayOrder', 'File_Guid', 'File_ViewGradebook', 'File_Points', 'File_Pages', 'File_SizeKb', 'Settings_EnableRetakes', 'Settings_ForcePassTest', 'Settings_TakeInOrder', 'Settings_SaveAndResume', 'Settings_Resumes', 'Settings_IsTimed', 'Settings_DefaultTime', 'Settings_ShowFeedback', 'Settings_ShowAnswers', 'Settings_AllowRetakes', 'Settings_Retakes', 'Settings_ShowStudyGuide', 'Settings_IsPooling', 'Settings_PoolSize', 'Settings_IsProctored', 'Settings_UseAnyProctor', 'Settings_ProctorId', 'Settings_IsFullScreen', 'Download_Id', 'Download_Name', 'Download_Title', 'Download_Url', 'Download_SizeKb', 'Track_MediaId', 'Track_Label', 'Track_Name', 'Track_Url']
+}
 
+def initialize_csv_files(directory):
     csv_writers = {}
-    for name, headers in csv_files.items():
+    for name, headers in CSV_HEADERS.items():
         file_path = os.path.join(directory, f"{name}.csv")
         f = open(file_path, 'w', newline='', encoding='utf-8-sig')  # Using utf-8-sig for better compatibility
         writer = csv.DictWriter(f, fieldnames=headers)
@@ -1,39 +1,271 @@
 import os
 import sys
+import argparse
 print("Python executable being used:", sys.executable)
 print("Python version:", sys.version)
 print("sys.path:", sys.path)
 from lxml import etree as ET
 import csv
 import html
+from html.parser import HTMLParser
 import json
 import re
 import base64
+import shutil
+import tempfile
+import gzip
+import io
+import tarfile
+import hashlib
+import sqlite3
+import time
+import queue
+import threading
+import functools
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from bs4 import BeautifulSoup
 import bleach
-
-def get_directory():
-    directory = input("Please enter the directory containing the XML files: ").strip()
+# pyarrow is only needed for --parquet
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+# zstandard is only needed for --compress zstd
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+# Pillow is only needed for --course-images
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+# inotify_simple is only used by --watch; without it (or off Linux) the folder is polled
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+ENTITY_NAMES = ['Course', 'Expert', 'Section', 'Lesson', 'Topic']
+
+def get_directory(directory=None):
+    if directory is None:
+        directory = input("Please enter the directory containing the XML files: ").strip()
     if not os.path.isdir(directory):
         print(f"The directory '{directory}' does not exist.")
         sys.exit(1)
     return directory
 
-def clean_html_content(html_content):
+# Pipeline instrumentation (--stats / --stats-file).
+# When enabled, pipeline_stats accumulates wall-clock time and call counts per stage, plain counters and the
+# number of topics per type. Stage times are inclusive (clean_value contains the clean_html_content and image
+# extraction it calls) and are summed over worker processes. When disabled, pipeline_stats is None and each
+# instrumented call costs one extra function call and a global lookup.
+class PipelineStats:
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.topic_types = {}
+
+    def add_time(self, stage, seconds, calls=1):
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    def count(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def count_topic(self, topic_type):
+        self.topic_types[topic_type] = self.topic_types.get(topic_type, 0) + 1
+
+    def as_dict(self):
+        return {
+            'stages': {stage: {'seconds': round(seconds, 6), 'calls': calls} for stage, (seconds, calls) in self.stages.items()},
+            'counters': dict(self.counters),
+            'topic_types': dict(self.topic_types),
+        }
+
+    def merge(self, report):
+        for stage, entry in report['stages'].items():
+            self.add_time(stage, entry['seconds'], entry['calls'])
+        for counter, amount in report['counters'].items():
+            self.count(counter, amount)
+        for topic_type, amount in report['topic_types'].items():
+            self.topic_types[topic_type] = self.topic_types.get(topic_type, 0) + amount
+
+pipeline_stats = None
+
+def configure_pipeline_stats(enabled):
+    global pipeline_stats
+    pipeline_stats = PipelineStats() if enabled else None
+
+def run_timed(stage, function, *args, **kwargs):
+    if pipeline_stats is None:
+        return function(*args, **kwargs)
+    start = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        pipeline_stats.add_time(stage, time.perf_counter() - start)
+
+def timed_stage(stage):
+    # Decorator that records the function's calls under `stage` while pipeline_stats is enabled
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if pipeline_stats is None:
+                return function(*args, **kwargs)
+            return run_timed(stage, function, *args, **kwargs)
+        return wrapper
+    return decorate
+
+def count_stat(counter, amount=1):
+    if pipeline_stats is not None:
+        pipeline_stats.count(counter, amount)
+
+def write_pipeline_report(report_path, report):
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+def print_pipeline_summary(report, report_path):
+    print("Pipeline stages (inclusive wall-clock seconds, summed over worker processes):")
+    stages = sorted(report['stages'].items(), key=lambda item: item[1]['seconds'], reverse=True)
+    for stage, entry in stages:
+        print(f"  {stage:<24} {entry['seconds']:>10.3f}s {entry['calls']:>10} calls")
+    if report['topic_types']:
+        print("Topics by type:")
+        for topic_type, amount in sorted(report['topic_types'].items(), key=lambda item: (-item[1], item[0])):
+            print(f"  {topic_type:<60} {amount:>8}")
+    print(f"Pipeline report written to '{report_path}'.")
+
+# Skipped topic log (--skip-log / --verbose).
+# Topics whose type isn't configured yet are written as JSON lines to a buffered log file instead of being
+# pretty-printed to the console, and counted per type for a summary at the end of the run. --verbose brings
+# back the live console output. Worker processes write to part files next to the log (closed after every XML
+# file), named with the run's id and their PID, which the parent appends to the log once all files are converted.
+# Only the parts of the current run are merged; parts left behind by a crashed run are deleted when the next starts.
+SKIP_LOG_BUFFER_BYTES = 1024 * 1024
+
+class SkippedTopicLog:
+    def __init__(self, path=None, verbose=False, part=False, run_id=None):
+        self.log_path = path
+        self.verbose = verbose
+        self.part = part
+        self.run_id = run_id or f"{os.getpid()}-{os.urandom(4).hex()}"
+        self.path = f"{path}.{self.run_id}.{os.getpid()}.part" if path and part else path
+        self.handle = None
+        self.counts = {}
+        if self.path and not part:
+            # Start every run with an empty log and without the parts of earlier runs
+            open(self.path, 'w', encoding='utf-8').close()
+            for part_path in self.find_parts(''):
+                os.remove(part_path)
+
+    def settings(self):
+        return (self.log_path, self.verbose)
+
+    def worker_settings(self):
+        return (self.log_path, self.verbose, self.run_id)
+
+    def find_parts(self, run_id):
+        # Part files of the run with this id (all runs for '')
+        log_dir = os.path.dirname(os.path.abspath(self.path))
+        prefix = f"{os.path.basename(self.path)}.{run_id}"
+        return sorted(os.path.join(log_dir, f) for f in os.listdir(log_dir) if f.startswith(prefix) and f.endswith('.part'))
+
+    def record(self, reason, topic_type, topic_data):
+        self.counts[topic_type] = self.counts.get(topic_type, 0) + 1
+        if self.verbose:
+            print(reason)
+            print(json.dumps(topic_data, indent=2))
+        if self.path:
+            if self.handle is None:
+                self.handle = open(self.path, 'a', encoding='utf-8', buffering=SKIP_LOG_BUFFER_BYTES)
+            self.handle.write(json.dumps({'reason': reason, 'type': topic_type, 'topic': topic_data}, ensure_ascii=False))
+            self.handle.write('\n')
+
+    def reset_counters(self):
+        self.counts = {}
+
+    def counters(self):
+        return dict(self.counts)
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def merge_parts(self):
+        # Appends the part files written by worker processes to the log
+        self.close()
+        if not self.path or self.part:
+            return
+        with open(self.path, 'ab') as log:
+            for part_path in self.find_parts(f"{self.run_id}."):
+                with open(part_path, 'rb') as part:
+                    shutil.copyfileobj(part, log)
+                os.remove(part_path)
+
+skipped_topic_log = None
+
+def configure_skipped_topic_log(path=None, verbose=False, part=False, run_id=None):
+    global skipped_topic_log
+    if skipped_topic_log is not None:
+        skipped_topic_log.close()
+    skipped_topic_log = SkippedTopicLog(path, verbose, part, run_id)
+
+def record_skipped_topic(reason, topic_type, topic_data):
+    if skipped_topic_log is None:
+        # Without a configured log (e.g. when imported by another script), keep the console output
+        print(reason)
+        print(json.dumps(topic_data, indent=2))
+        return
+    skipped_topic_log.record(reason, topic_type, topic_data)
+
+def print_skipped_topic_summary(counts, log_path):
+    if not counts:
+        return
+    print(f"Skipped {sum(counts.values())} topics whose type is not yet configured:")
+    for topic_type, amount in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+        print(f"  {topic_type:<60} {amount:>8}")
+    if log_path:
+        print(f"Details of the skipped topics in converted files are in '{log_path}'.")
+
+# Sanitizer policy shared by clean_html_content and its result cache.
+# Bump HTML_SANITIZER_VERSION whenever the cleaning steps change so that cached results are not reused.
+HTML_SANITIZER_VERSION = 1
+
+ALLOWED_TAGS = [
+    'p', 'ul', 'ol', 'li', 'a', 'strong', 'em', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'blockquote', 'code', 'pre', 'img', 'figure', 'figcaption', 'br', 'hr'
+]
+
+ALLOWED_ATTRIBUTES = {
+    '*': ['class', 'id'],
+    'a': ['href', 'title', 'download'],
+    'img': ['src', 'alt', 'title'],
+}
+
+def get_sanitizer_policy_key():
+    policy = {
+        'version': HTML_SANITIZER_VERSION,
+        'engine': html_sanitizer_engine,
+        'tags': ALLOWED_TAGS,
+        'attributes': ALLOWED_ATTRIBUTES,
+    }
+    return hashlib.sha256(json.dumps(policy, sort_keys=True).encode('utf-8')).hexdigest()
+
+def sanitize_html_content(html_content):
     # Strip leading and trailing whitespace
     html_content = html_content.strip()
     soup = BeautifulSoup(html_content, 'html.parser')
 
-    allowed_tags = [
-        'p', 'ul', 'ol', 'li', 'a', 'strong', 'em', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-        'blockquote', 'code', 'pre', 'img', 'figure', 'figcaption', 'br', 'hr'
-    ]
-
-    allowed_attributes = {
-        '*': ['class', 'id'],
-        'a': ['href', 'title', 'download'],
-        'img': ['src', 'alt', 'title'],
-    }
+    allowed_tags = ALLOWED_TAGS
+    allowed_attributes = ALLOWED_ATTRIBUTES
 
     # Remove empty text nodes
     for element in soup.find_all(string=lambda text: isinstance(text, str) and not text.strip()):
@@ -82,7 +314,732 @@ def clean_html_content(html_content):
 
     return cleaned_html.strip()
 
+# Single-pass sanitizer engine (--sanitizer single-pass).
+# sanitize_html_content builds a BeautifulSoup DOM, serializes it for bleach (which re-parses it with
+# html5lib) and parses bleach's output again to drop the tags that became empty. The engine below
+# tokenizes the input once with html.parser (the same tokenizer BeautifulSoup uses), applies the div->p
+# conversion, attribute allowlist, font/span unwrapping, empty-tag removal and tag allowlist in one walk
+# over that tree, and rebuilds the allowed tags with the subset of html5lib's tree-construction rules
+# that can apply to them (block elements closing an open <p>, list items closing list items, headings
+# closing headings, formatting elements being reopened). It produces the same output as
+# sanitize_html_content for the descriptions found in the Skillify exports, with one known exception: a '<'
+# inside <script> or <style> text. The bleach pipeline writes that text back unescaped, and the next parse
+# reads the '<' as the start of a tag, so '<script>if(a<b){}</script><p>x</p>' becomes 'if(a<p>x</p>'. The
+# single-pass engine keeps it as text: 'if(a&lt;b){}<p>x</p>'. See KNOWN_DIVERGENCES in
+# skillify_sanitizer_check.py, which also has the equivalence check and benchmark.
+
+# Tags that html.parser/BeautifulSoup never push onto the open-element stack
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+    'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer'
+}
+# Tags whose strings BeautifulSoup does not count in get_text(); the first two are also kept unescaped
+NON_TEXT_TAGS = {'script', 'style', 'template', 'rt', 'rp'}
+RAW_TEXT_TAGS = {'script', 'style'}
+# Disallowed tags that bleach replaces with a line break when it strips them
+BLOCK_LEVEL_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'details', 'dialog', 'dd', 'div', 'dl', 'dt', 'fieldset',
+    'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hgroup', 'hr',
+    'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'ul'
+}
+# Allowed tags that html5lib treats as formatting elements or as "special" block elements
+FORMATTING_TAGS = {'a', 'code', 'em', 'strong'}
+SPECIAL_TAGS = {
+    'blockquote', 'br', 'figure', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'img', 'li',
+    'ol', 'p', 'pre', 'ul', '#root'
+}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+P_CLOSING_TAGS = {'blockquote', 'figcaption', 'figure', 'ol', 'p', 'ul', 'pre', 'hr'} | HEADING_TAGS
+URI_ATTRIBUTES = {'href', 'src'}
+ASCII_WHITESPACE = ' \n\t\x0c\r'
+ALLOWED_PROTOCOLS = {'http', 'https', 'mailto'}
+
+class HtmlFragmentParser(HTMLParser):
+    # Builds the same element tree as BeautifulSoup's html.parser builder.
+    # Elements are [name, attrs, children] lists; text nodes are [None, text, counts_as_text, is_raw].
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = ['#root', {}, []]
+        self.stack = [self.root]
+        self.text_parts = []
+        self.closed_void_tags = []
+
+    def flush_text(self):
+        if self.text_parts:
+            text = ''.join(self.text_parts)
+            self.text_parts = []
+            # Whitespace-only strings are dropped, as the first cleaning step does
+            if text.strip():
+                parent = self.stack[-1]
+                parent[2].append([None, text, parent[0] not in NON_TEXT_TAGS, parent[0] in RAW_TEXT_TAGS])
+
+    def handle_starttag(self, tag, attrs, close_void=True):
+        self.flush_text()
+        element = [tag, {name: value if value is not None else '' for name, value in attrs}, []]
+        self.stack[-1][2].append(element)
+        self.stack.append(element)
+        if tag in VOID_TAGS and close_void:
+            # BeautifulSoup closes void tags straight away and then ignores one matching end tag, so
+            # after <br> a <br/> stays open and takes in the content that follows it
+            self.close_element(tag)
+            self.closed_void_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, close_void=False)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_void_tags:
+            self.closed_void_tags.remove(tag)
+        else:
+            self.close_element(tag)
+
+    def close_element(self, tag):
+        self.flush_text()
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index][0] == tag:
+                del self.stack[index:]
+                break
+
+    def handle_data(self, data):
+        self.text_parts.append(data)
+
+    # Comments stay in the tree until bleach drops them; they never count as text
+    def handle_comment(self, data):
+        self.flush_text()
+        self.stack[-1][2].append(['#comment', data, []])
+
+    # Declarations end the current string but are otherwise dropped
+    def handle_decl(self, decl):
+        self.flush_text()
+
+    def handle_pi(self, data):
+        self.flush_text()
+
+    def unknown_decl(self, data):
+        self.flush_text()
+
+class RawHtmlTokenizer(HTMLParser):
+    # Script and style contents are written out unescaped by BeautifulSoup, so bleach tokenizes them as
+    # markup. This tokenizer feeds such text to the tree builder the same way. Nested <script>/<style>
+    # tags are stripped by bleach before they could switch the tokenizer into raw-text mode.
+    CDATA_CONTENT_ELEMENTS = ()
+
+    def __init__(self, builder):
+        super().__init__(convert_charrefs=True)
+        self.builder = builder
+
+    def handle_starttag(self, tag, attrs):
+        # html5lib keeps the first of duplicated attributes
+        attrs = {name: value if value is not None else '' for name, value in reversed(attrs)}
+        if tag in ALLOWED_TAGS:
+            kind = 'void' if tag in VOID_TAGS else 'start'
+            self.builder.feed((kind, tag, filter_allowed_attributes(tag, attrs)))
+        else:
+            self.builder.feed(('stripped', tag, True))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in ALLOWED_TAGS:
+            self.builder.feed(('end', tag))
+        else:
+            self.builder.feed(('stripped', tag, False))
+
+    def handle_data(self, data):
+        self.builder.feed(('text', data))
+
+    def handle_comment(self, data):
+        self.builder.feed(('comment',))
+
+def is_allowed_uri(value):
+    # Mirrors bleach's protocol check for href/src values
+    normalized = re.sub(r"[`\000-\040\177-\240\s]+", '', html.unescape(value)).lower()
+    scheme, separator, _ = normalized.partition(':')
+    if not separator or not re.fullmatch(r'[a-z][a-z0-9+.\-]*', scheme):
+        return True
+    return scheme in ALLOWED_PROTOCOLS
+
+def collect_allowed_tokens(node, tokens):
+    # One walk over the parsed tree. Returns (has_text, has_media) for the node's subtree and appends
+    # the tokens that survive the cleaning steps: allowed tags with their filtered attributes, stripped
+    # (disallowed) tags, text, and raw script/style text.
+    if node[0] is None:
+        tokens.append(('raw' if node[3] else 'text', node[1]))
+        return node[2], False
+    if node[0] == '#comment':
+        tokens.append(('comment',))
+        return False, False
+
+    name = 'p' if node[0] == 'div' else node[0]
+    unwrap = name in ('font', 'span')
+
+    start = len(tokens)
+    if name in ALLOWED_TAGS:
+        kind = 'void' if name in VOID_TAGS else 'start'
+        tokens.append((kind, name, filter_allowed_attributes(name, node[1])))
+    elif not unwrap and name != '#root':
+        tokens.append(('stripped', name, True))
+    has_text = False
+    has_media = name in ('br', 'img')
+    for child in node[2]:
+        child_text, child_media = collect_allowed_tokens(child, tokens)
+        has_text = has_text or child_text
+        has_media = has_media or child_media
+
+    if has_media and name in VOID_TAGS and len(tokens) == start + 1:
+        # A <br> or <img> that kept nothing inside it is written without an end tag
+        return has_text, has_media
+    # Script/style/template strings only count as text for the element that contains them directly
+    own_text = has_text or (name in NON_TEXT_TAGS and any(child[0] is None for child in node[2]))
+    if not own_text and not has_media and name != '#root' and not unwrap:
+        # Empty tag: drop it together with everything inside it
+        del tokens[start:]
+    elif name in ALLOWED_TAGS:
+        tokens.append(('end', name))
+    elif not unwrap and name != '#root':
+        tokens.append(('stripped', name, False))
+    return has_text, has_media
+
+def filter_allowed_attributes(name, attrs):
+    allowed = ALLOWED_ATTRIBUTES.get(name, []) + ALLOWED_ATTRIBUTES.get('*', [])
+    filtered = {}
+    for attr, value in attrs.items():
+        if attr not in allowed:
+            continue
+        if attr in URI_ATTRIBUTES and not is_allowed_uri(value):
+            continue
+        if attr == 'class':
+            value = ' '.join(value.split())
+        filtered[attr] = value
+    return filtered
+
+def index_of(elements, element):
+    # list.index compares by value; tree elements have to be matched by identity
+    for index, candidate in enumerate(elements):
+        if candidate is element:
+            return index
+    return -1
+
+class AllowedTagTreeBuilder:
+    # Rebuilds the allowed tokens into a tree with html5lib's in-body insertion rules for these tags.
+    # Elements are [name, attrs, children, parent] lists; text nodes are [None, text].
+    def __init__(self):
+        self.root = ['#root', {}, [], None]
+        self.stack = [self.root]
+        self.active_formatting = []
+        self.drop_newline = False
+        self.tag_emitted = False
+
+    def insert(self, name, attrs):
+        parent = self.stack[-1]
+        element = [name, dict(attrs), [], parent]
+        parent[2].append(element)
+        return element
+
+    def insert_text(self, text):
+        self.reconstruct_formatting()
+        if text:
+            children = self.stack[-1][2]
+            if children and children[-1][0] is None:
+                children[-1][1] += text
+            else:
+                children.append([None, text])
+
+    def move_to(self, element, parent):
+        if element[3] is not None:
+            siblings = element[3][2]
+            del siblings[index_of(siblings, element)]
+        parent[2].append(element)
+        element[3] = parent
+
+    def in_scope(self, names, list_scope=False):
+        for element in reversed(self.stack):
+            if element[0] in names:
+                return True
+            if list_scope and element[0] in ('ol', 'ul'):
+                return False
+        return False
+
+    def generate_implied_end_tags(self, exclude=None):
+        while self.stack[-1][0] in ('li', 'p') and self.stack[-1][0] != exclude:
+            self.stack.pop()
+
+    def pop_until(self, names):
+        while len(self.stack) > 1:
+            if self.stack.pop()[0] in names:
+                break
+
+    def close_p(self):
+        if self.in_scope(('p',)):
+            self.generate_implied_end_tags('p')
+            self.pop_until(('p',))
+
+    def last_formatting_element(self, name):
+        for element in reversed(self.active_formatting):
+            if element[0] == name:
+                return element
+        return None
+
+    def add_formatting_element(self, name, attrs):
+        # Keep at most three identical entries in the list of active formatting elements
+        matching = [e for e in self.active_formatting if e[0] == name and e[1] == attrs]
+        if len(matching) >= 3:
+            del self.active_formatting[index_of(self.active_formatting, matching[0])]
+        element = self.insert(name, attrs)
+        self.stack.append(element)
+        self.active_formatting.append(element)
+
+    def reconstruct_formatting(self):
+        if not self.active_formatting or index_of(self.stack, self.active_formatting[-1]) >= 0:
+            return
+        index = len(self.active_formatting) - 1
+        while index > 0 and index_of(self.stack, self.active_formatting[index - 1]) < 0:
+            index -= 1
+        for position in range(index, len(self.active_formatting)):
+            entry = self.active_formatting[position]
+            element = self.insert(entry[0], entry[1])
+            self.stack.append(element)
+            self.active_formatting[position] = element
+
+    def end_formatting(self, name):
+        # html5lib's adoption agency algorithm
+        for _ in range(8):
+            formatting_element = self.last_formatting_element(name)
+            if formatting_element is None:
+                self.end_other(name)
+                return
+            element_index = index_of(self.stack, formatting_element)
+            if element_index < 0:
+                del self.active_formatting[index_of(self.active_formatting, formatting_element)]
+                return
+
+            furthest_block = None
+            for element in self.stack[element_index:]:
+                if element[0] in SPECIAL_TAGS:
+                    furthest_block = element
+                    break
+            if furthest_block is None:
+                del self.stack[element_index:]
+                del self.active_formatting[index_of(self.active_formatting, formatting_element)]
+                return
+
+            common_ancestor = self.stack[element_index - 1]
+            bookmark = index_of(self.active_formatting, formatting_element)
+            last_node = furthest_block
+            index = index_of(self.stack, furthest_block)
+            for _ in range(3):
+                index -= 1
+                node = self.stack[index]
+                if index_of(self.active_formatting, node) < 0:
+                    del self.stack[index]
+                    continue
+                if node is formatting_element:
+                    break
+                if last_node is furthest_block:
+                    bookmark = index_of(self.active_formatting, node) + 1
+                clone = [node[0], dict(node[1]), [], None]
+                self.active_formatting[index_of(self.active_formatting, node)] = clone
+                self.stack[index_of(self.stack, node)] = clone
+                self.move_to(last_node, clone)
+                last_node = clone
+            self.move_to(last_node, common_ancestor)
+
+            clone = [formatting_element[0], dict(formatting_element[1]), furthest_block[2], furthest_block]
+            for child in clone[2]:
+                if child[0] is not None:
+                    child[3] = clone
+            furthest_block[2] = [clone]
+            del self.active_formatting[index_of(self.active_formatting, formatting_element)]
+            self.active_formatting.insert(bookmark, clone)
+            del self.stack[index_of(self.stack, formatting_element)]
+            self.stack.insert(index_of(self.stack, furthest_block) + 1, clone)
+
+    def end_other(self, name):
+        for index in range(len(self.stack) - 1, 0, -1):
+            element = self.stack[index]
+            if element[0] == name:
+                self.generate_implied_end_tags(name)
+                del self.stack[index:]
+                return
+            if element[0] in SPECIAL_TAGS:
+                return
+
+    def feed(self, token):
+        kind = token[0]
+        if kind == 'raw':
+            tokenizer = RawHtmlTokenizer(self)
+            tokenizer.feed(token[1])
+            tokenizer.close()
+            return
+        if kind == 'stripped':
+            # bleach turns a stripped tag into an empty string, or into a line break for block-level
+            # start tags that follow another tag
+            newline = token[2] and token[1] in BLOCK_LEVEL_TAGS and self.tag_emitted
+            self.tag_emitted = True
+            self.insert_text('\n' if newline else '')
+            return
+        if kind == 'comment':
+            # bleach drops comments, but while they sit in the tree a <pre> counts as having content
+            if self.stack[-1][0] == 'pre':
+                self.drop_newline = False
+            return
+        if kind == 'text':
+            text = token[1]
+            # Like html5lib, only the first whitespace run after <pre> can lose its leading newline
+            if self.drop_newline and text[:1] in ('\t', '\n', '\x0c', ' ', '\r'):
+                if text.startswith('\n') and self.stack[-1][0] == 'pre' and not self.stack[-1][2]:
+                    text = text[1:]
+                self.drop_newline = False
+            self.insert_text(text)
+            return
+
+        self.tag_emitted = True
+        name = token[1]
+        if kind in ('start', 'void'):
+            attrs = token[2]
+            if name in P_CLOSING_TAGS:
+                self.close_p()
+            if name in HEADING_TAGS and self.stack[-1][0] in HEADING_TAGS:
+                self.stack.pop()
+            if name == 'li':
+                for element in reversed(self.stack):
+                    if element[0] == 'li':
+                        self.generate_implied_end_tags('li')
+                        self.pop_until(('li',))
+                        break
+                    if element[0] in SPECIAL_TAGS and element[0] != 'p':
+                        break
+                self.close_p()
+            if name == 'a':
+                anchor = self.last_formatting_element('a')
+                if anchor is not None:
+                    self.end_formatting('a')
+                    if index_of(self.stack, anchor) >= 0:
+                        del self.stack[index_of(self.stack, anchor)]
+                    if index_of(self.active_formatting, anchor) >= 0:
+                        del self.active_formatting[index_of(self.active_formatting, anchor)]
+            if name in FORMATTING_TAGS:
+                self.reconstruct_formatting()
+                self.add_formatting_element(name, attrs)
+            elif kind == 'void':
+                if name != 'hr':
+                    self.reconstruct_formatting()
+                self.insert(name, attrs)
+            else:
+                self.stack.append(self.insert(name, attrs))
+                self.drop_newline = name == 'pre'
+        elif name == 'br':
+            # html5lib treats </br> as <br>
+            self.feed(('void', 'br', {}))
+        elif name in FORMATTING_TAGS:
+            self.end_formatting(name)
+        elif name == 'p':
+            if not self.in_scope(('p',)):
+                self.insert('p', {})
+            else:
+                self.generate_implied_end_tags('p')
+                self.pop_until(('p',))
+        elif name == 'li':
+            if self.in_scope(('li',), list_scope=True):
+                self.generate_implied_end_tags('li')
+                self.pop_until(('li',))
+        elif name in HEADING_TAGS:
+            if self.in_scope(HEADING_TAGS):
+                self.generate_implied_end_tags()
+                self.pop_until(HEADING_TAGS)
+        elif self.in_scope((name,)):
+            self.generate_implied_end_tags()
+            self.pop_until((name,))
+
+def escape_html_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def serialize_cleaned_tree(node, parts, in_pre=False):
+    # Serializes the rebuilt tree the way BeautifulSoup's str() does after re-parsing bleach's output:
+    # tags without text, <img> or <br> are dropped and whitespace-only strings outside <pre> are
+    # collapsed to a single newline or space. Returns (has_text, has_media).
+    if node[0] is None:
+        text = node[1]
+        if not in_pre and not text.strip(ASCII_WHITESPACE):
+            text = '\n' if '\n' in text else ' '
+        parts.append(escape_html_text(text))
+        return bool(text.strip()), False
+    name = node[0]
+    attributes = ''.join(
+        f' {attr}={quote_html_attribute(escape_html_text(node[1][attr]))}' for attr in sorted(node[1])
+    )
+    if name in ('br', 'img'):
+        parts.append(f'<{name}{attributes}/>')
+        return False, True
+    if name == 'hr':
+        return False, False
+
+    start = len(parts)
+    if name != '#root':
+        parts.append(f'<{name}{attributes}>')
+    has_text = False
+    has_media = False
+    for child in node[2]:
+        child_text, child_media = serialize_cleaned_tree(child, parts, in_pre or name == 'pre')
+        has_text = has_text or child_text
+        has_media = has_media or child_media
+    if name != '#root':
+        if not has_text and not has_media:
+            del parts[start:]
+        else:
+            parts.append(f'</{name}>')
+    return has_text, has_media
+
+def quote_html_attribute(value):
+    if '"' in value:
+        if "'" in value:
+            return '"' + value.replace('"', '&quot;') + '"'
+        return f"'{value}'"
+    return f'"{value}"'
+
+def sanitize_html_content_single_pass(html_content):
+    parser = HtmlFragmentParser()
+    parser.feed(html_content.strip())
+    parser.close()
+    parser.flush_text()
+
+    tokens = []
+    collect_allowed_tokens(parser.root, tokens)
+
+    builder = AllowedTagTreeBuilder()
+    for token in tokens:
+        builder.feed(token)
+
+    parts = []
+    serialize_cleaned_tree(builder.root, parts)
+    return ''.join(parts).strip()
+
+HTML_SANITIZER_ENGINES = {
+    'bleach': sanitize_html_content,
+    'single-pass': sanitize_html_content_single_pass,
+}
+
+# Engine used by clean_html_content. Set it before configure_html_cache, whose keys include the engine name.
+html_sanitizer_engine = 'bleach'
+
+def set_html_sanitizer(engine):
+    global html_sanitizer_engine
+    if engine not in HTML_SANITIZER_ENGINES:
+        raise ValueError(f"Unknown HTML sanitizer '{engine}'.")
+    html_sanitizer_engine = engine
+
+# Writes to the SQLite layer are buffered in memory and committed in one short transaction per batch or interval,
+# so the write lock is never held while HTML is being sanitized and worker processes sharing the database don't
+# wait on each other. A write that still can't get the lock within HTML_CACHE_LOCK_TIMEOUT is skipped.
+HTML_CACHE_BATCH_WRITES = 1000
+HTML_CACHE_BATCH_SECONDS = 2.0
+HTML_CACHE_LOCK_TIMEOUT = 10
+
+class HtmlCleanCache:
+    # Content-addressed cache for sanitized HTML. Entries are keyed by a hash of the sanitizer policy
+    # and the input HTML, so identical boilerplate descriptions are only sanitized once.
+    # An in-process LRU layer sits in front of an optional SQLite database that keeps results
+    # across runs and is trimmed back to max_db_bytes by evicting the least recently used entries.
+    def __init__(self, max_entries=10000, db_path=None, max_db_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.max_db_bytes = max_db_bytes
+        self.policy_key = get_sanitizer_policy_key()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.write_errors = 0
+        self.db = None
+        # key -> value of new entries and key -> last_used of disk hits, not yet written to the database
+        self.pending_inserts = {}
+        self.pending_touches = {}
+        self.last_flush = time.monotonic()
+        self.db_bytes = 0
+        if db_path:
+            self.db = sqlite3.connect(db_path, timeout=HTML_CACHE_LOCK_TIMEOUT)
+            # WAL lets the other workers keep reading while one of them commits a batch
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS html_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)'
+            )
+            self.db.execute('CREATE INDEX IF NOT EXISTS html_cache_last_used ON html_cache (last_used)')
+            self.db.commit()
+            self.db_bytes = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM html_cache').fetchone()[0]
+
+    def settings(self):
+        return (self.max_entries, self.db_path, self.max_db_bytes)
+
+    def key_for(self, html_content):
+        return hashlib.sha256(f"{self.policy_key}\0{html_content}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if key in self.pending_inserts:
+            self.hits += 1
+            return self.pending_inserts[key]
+        if self.db is not None:
+            try:
+                # fetchall finishes the statement, so no read transaction stays open to block the next commit
+                rows = self.db.execute('SELECT value FROM html_cache WHERE key = ?', (key,)).fetchall()
+            except sqlite3.OperationalError:
+                rows = []
+            if rows:
+                self.pending_touches[key] = time.time()
+                self.note_write()
+                self.hits += 1
+                self.disk_hits += 1
+                self.remember(key, rows[0][0])
+                return rows[0][0]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.remember(key, value)
+        if self.db is not None:
+            self.pending_inserts[key] = value
+            self.note_write()
+
+    def remember(self, key, value):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def note_write(self):
+        # Commit in batches; committing every statement would make the disk layer slower than sanitizing
+        if (len(self.pending_inserts) + len(self.pending_touches) >= HTML_CACHE_BATCH_WRITES
+                or time.monotonic() - self.last_flush >= HTML_CACHE_BATCH_SECONDS):
+            self.flush()
+
+    def flush(self):
+        if self.db is None:
+            return
+        inserts = self.pending_inserts
+        touches = self.pending_touches
+        self.pending_inserts = {}
+        self.pending_touches = {}
+        self.last_flush = time.monotonic()
+        if not inserts and not touches and self.db_bytes <= self.max_db_bytes:
+            return
+        now = time.time()
+        added_bytes = 0
+        try:
+            with self.db:
+                for key, value in inserts.items():
+                    size = len(key) + len(value.encode('utf-8'))
+                    cursor = self.db.execute(
+                        'INSERT OR IGNORE INTO html_cache (key, value, size, last_used) VALUES (?, ?, ?, ?)',
+                        (key, value, size, now)
+                    )
+                    added_bytes += size * cursor.rowcount
+                self.db.executemany('UPDATE html_cache SET last_used = ? WHERE key = ?',
+                                    [(last_used, key) for key, last_used in touches.items()])
+                if self.db_bytes + added_bytes > self.max_db_bytes:
+                    # trim recounts db_bytes from the table, including this batch
+                    self.trim()
+                else:
+                    self.db_bytes += added_bytes
+        except sqlite3.OperationalError:
+            # Another process held the lock too long; this batch just isn't cached
+            self.write_errors += 1
+
+    def trim(self):
+        # Evict the least recently used entries until the database is back under 90% of its size limit
+        self.db_bytes = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM html_cache').fetchone()[0]
+        target_bytes = self.max_db_bytes * 0.9
+        while self.db_bytes > target_bytes:
+            oldest = self.db.execute('SELECT key, size FROM html_cache ORDER BY last_used LIMIT 1000').fetchall()
+            if not oldest:
+                break
+            evicted = []
+            for key, size in oldest:
+                evicted.append((key,))
+                self.db_bytes -= size
+                if self.db_bytes <= target_bytes:
+                    break
+            self.db.executemany('DELETE FROM html_cache WHERE key = ?', evicted)
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
+
+    def reset_counters(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.write_errors = 0
+
+    def counters(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'write_errors': self.write_errors}
+
+# Cache used by clean_html_content; None means every call sanitizes from scratch
+html_clean_cache = None
+
+def configure_html_cache(max_entries=10000, db_path=None, max_db_bytes=256 * 1024 * 1024):
+    global html_clean_cache
+    if html_clean_cache is not None:
+        html_clean_cache.close()
+    if max_entries > 0 or db_path:
+        html_clean_cache = HtmlCleanCache(max_entries, db_path, max_db_bytes)
+    else:
+        html_clean_cache = None
+
+def print_html_cache_summary(counters):
+    lookups = counters['hits'] + counters['misses']
+    if lookups:
+        print(f"HTML cleaning cache: {counters['hits']} hits ({counters['disk_hits']} from disk), "
+              f"{counters['misses']} misses, {counters['hits'] / lookups:.1%} hit rate.")
+    if counters.get('write_errors'):
+        print(f"  {counters['write_errors']} cache write batches were skipped because the database was locked.")
+
+class SanitizedHtml(str):
+    # HTML that clean_html_content has already sanitized. clean_value and clean_html_content hand these back
+    # unchanged, so a value that is passed through them again later (like a File description that becomes part
+    # of a topic body) is only unescaped and sanitized once. Note that str methods such as strip() return a
+    # plain str, which drops the marker.
+    __slots__ = ()
+
+@timed_stage('clean_html_content')
+def clean_html_content(html_content):
+    if isinstance(html_content, SanitizedHtml):
+        count_stat('sanitize_skipped')
+        return html_content
+    sanitize = HTML_SANITIZER_ENGINES[html_sanitizer_engine]
+    if html_clean_cache is None:
+        return SanitizedHtml(run_timed('sanitize_html', sanitize, html_content))
+    key = html_clean_cache.key_for(html_content)
+    cleaned_html = html_clean_cache.get(key)
+    if cleaned_html is None:
+        cleaned_html = run_timed('sanitize_html', sanitize, html_content)
+        html_clean_cache.put(key, cleaned_html)
+    return SanitizedHtml(cleaned_html)
+
+def join_sanitized_html(*fragments):
+    # Concatenates HTML fragments into one sanitized value, sanitizing only the fragments that aren't yet.
+    # Each fragment is sanitized on its own, so markup left as text in one fragment (an escaped '<') can't
+    # combine with the next one; see BODY_ASSEMBLY_CASES in skillify_sanitizer_check.py.
+    fragments = [fragment if isinstance(fragment, SanitizedHtml) else fragment.strip() for fragment in fragments]
+    return SanitizedHtml(''.join(clean_html_content(fragment) for fragment in fragments if fragment))
+
+@timed_stage('clean_value')
 def clean_value(value, output_dir='', unique_id=''):
+    if isinstance(value, SanitizedHtml):
+        count_stat('sanitize_skipped')
+        return value
     if value:
         # Unescape HTML entities.
         value = html.unescape(html.unescape(value))
@@ -97,39 +1054,202 @@ def clean_value(value, output_dir='', unique_id=''):
         return value
     return value
 
-def extract_base64_images(html_content, output_dir, unique_id):
-    # Ensure the images directory exists
-    images_dir = os.path.join(output_dir, "images")
+# Base64 images embedded in HTML values are written to the images folder under a name derived from
+# their content, so an image that appears in hundreds of topics is stored once and shared.
+BASE64_IMAGE_MARKER = 'src="data:image/'
+BASE64_CHUNK_CHARS = 64 * 1024  # must be a multiple of 4
+# Bytes that b64decode would skip; deleting them up front keeps the chunks aligned to whole quanta
+BASE64_NON_ALPHABET = bytes(
+    byte for byte in range(256)
+    if byte not in b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/='
+)
+IMAGE_EXTENSION_PATTERN = re.compile(r'[A-Za-z0-9.+-]+')
+
+# Hash of the base64 text -> stored filename, so repeated images are not decoded again in this process
+stored_base64_images = {}
+
+def iter_base64_chunks(base64_data):
+    # Decodes base64 text in chunks. Raises base64.binascii.Error for invalid data, as b64decode does.
+    pending = b''
+    for start in range(0, len(base64_data), BASE64_CHUNK_CHARS):
+        chunk = pending + base64_data[start:start + BASE64_CHUNK_CHARS].encode('utf-8').translate(None, BASE64_NON_ALPHABET)
+        if b'=' in chunk:
+            # Decoding stops at the padding, so hand the rest over in one piece like b64decode would get it
+            chunk += base64_data[start + BASE64_CHUNK_CHARS:].encode('utf-8').translate(None, BASE64_NON_ALPHABET)
+            yield base64.b64decode(chunk)
+            return
+        usable = len(chunk) - len(chunk) % 4
+        pending = chunk[usable:]
+        yield base64.b64decode(chunk[:usable])
+    if pending:
+        # Leftover characters that do not make up a full quantum raise the padding error
+        base64.b64decode(pending)
+
+def write_image_file(image_path, chunks):
+    # Writes to a temporary name first so that a partly written image is never visible under its final name
+    images_dir = os.path.dirname(image_path)
     os.makedirs(images_dir, exist_ok=True)
-
-    # Regular expression to find base64 image data.
-    base64_pattern = r'src="data:image/(?P<ext>[^;]+);base64,(?P<data>.+?)"'
-
-    image_counter = 0
-
-    def replacer(match):
-        nonlocal image_counter
-        ext = match.group('ext')
-        base64_data = match.group('data')
-        # Decode the base64 data.
+    handle, temp_path = tempfile.mkstemp(suffix='.part', dir=images_dir)
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    os.replace(temp_path, image_path)
+
+class ImageWriter:
+    # Writes extracted images on background threads so that parsing does not wait for the disk.
+    # The queue is bounded, which caps the decoded image data waiting in memory, and flush() is the
+    # barrier that returns once every queued image has been written.
+    def __init__(self, threads=4, queue_size=64):
+        self.thread_count = threads
+        self.queue_size = queue_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.pending = set()
+        self.error = None
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def settings(self):
+        return (self.thread_count, self.queue_size)
+
+    def submit(self, image_path, chunks):
+        self.pending.add(image_path)
+        self.queue.put((image_path, chunks))
+
+    def is_pending(self, image_path):
+        return image_path in self.pending
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                write_image_file(*job)
+            except OSError as e:
+                if self.error is None:
+                    self.error = e
+            finally:
+                if job is not None:
+                    self.pending.discard(job[0])
+                self.queue.task_done()
+
+    def flush(self):
+        self.queue.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self):
         try:
-            image_data = base64.b64decode(base64_data)
+            self.flush()
+        finally:
+            for _ in self.threads:
+                self.queue.put(None)
+            for thread in self.threads:
+                thread.join()
+
+image_writer = None
+
+def configure_image_writer(threads=4, queue_size=64):
+    global image_writer
+    if image_writer is not None:
+        image_writer.close()
+    image_writer = ImageWriter(threads, queue_size) if threads > 0 else None
+
+def flush_image_writer():
+    if image_writer is not None:
+        image_writer.flush()
+
+def store_base64_image(base64_data, ext, images_dir):
+    # Decodes the base64 data in chunks while hashing it and stores it under its content-addressed name
+    # unless an identical image is already there. With a background image writer the decoded chunks are
+    # queued for it; otherwise they are streamed to disk here.
+    # Returns the filename, or None if the data is not valid base64.
+    text_key = (hashlib.sha256(base64_data.encode('utf-8')).hexdigest(), ext)
+    filename = stored_base64_images.get(text_key)
+    if filename is not None:
+        image_path = os.path.join(images_dir, filename)
+        if os.path.exists(image_path) or (image_writer is not None and image_writer.is_pending(image_path)):
+            count_stat('base64_images_reused')
+            return filename
+
+    sha = hashlib.sha256()
+    if image_writer is not None:
+        try:
+            chunks = list(iter_base64_chunks(base64_data))
         except base64.binascii.Error:
-            return match.group(0)  # Return the original match if base64 data is invalid
-        # Increment image counter to ensure uniqueness
-        image_counter += 1
-        # Create a unique filename for the image.
-        image_filename = f"{unique_id}_image{image_counter}.{ext}"
-        image_path = os.path.join(images_dir, image_filename)
-        # Save the image file.
-        with open(image_path, 'wb') as img_file:
-            img_file.write(image_data)
-        # Return the new src attribute with the relative file path.
-        return f'src="images/{image_filename}"'
-
-    # Substitute base64 images in the HTML content.
-    processed_content = re.sub(base64_pattern, replacer, html_content, flags=re.DOTALL)
-    return processed_content
+            return None
+        for chunk in chunks:
+            sha.update(chunk)
+        filename = f"{sha.hexdigest()[:32]}.{ext}"
+        image_path = os.path.join(images_dir, filename)
+        if not os.path.exists(image_path) and not image_writer.is_pending(image_path):
+            image_writer.submit(image_path, chunks)
+            count_stat('base64_images_written')
+        else:
+            count_stat('base64_images_reused')
+    else:
+        os.makedirs(images_dir, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(suffix='.part', dir=images_dir)
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                for chunk in iter_base64_chunks(base64_data):
+                    sha.update(chunk)
+                    f.write(chunk)
+        except base64.binascii.Error:
+            os.remove(temp_path)
+            return None
+        filename = f"{sha.hexdigest()[:32]}.{ext}"
+        image_path = os.path.join(images_dir, filename)
+        if os.path.exists(image_path):
+            os.remove(temp_path)
+            count_stat('base64_images_reused')
+        else:
+            os.replace(temp_path, image_path)
+            count_stat('base64_images_written')
+    stored_base64_images[text_key] = filename
+    return filename
+
+@timed_stage('extract_base64_images')
+def extract_base64_images(html_content, output_dir, unique_id):
+    # Finds src="data:image/<ext>;base64,<data>" attributes with a linear scan and replaces each one with
+    # the relative path of the stored image. Images are named by content hash rather than by unique_id.
+    images_dir = os.path.join(output_dir, "images")
+    parts = []
+    position = 0
+    search_from = 0
+    while True:
+        start = html_content.find(BASE64_IMAGE_MARKER, search_from)
+        if start < 0:
+            break
+        search_from = start + len(BASE64_IMAGE_MARKER)
+        ext_end = html_content.find(';', search_from)
+        if ext_end < 0:
+            break
+        if not html_content.startswith(';base64,', ext_end):
+            continue
+        ext = html_content[search_from:ext_end]
+        data_start = ext_end + len(';base64,')
+        data_end = html_content.find('"', data_start + 1)
+        if data_end < 0:
+            break
+        if not IMAGE_EXTENSION_PATTERN.fullmatch(ext):
+            # Leave data URIs with odd image types alone rather than use them in a filename
+            continue
+        filename = store_base64_image(html_content[data_start:data_end], ext, images_dir)
+        search_from = data_end + 1
+        if filename is None:
+            continue  # Keep the original data URI if the base64 data is invalid
+        parts.append(html_content[position:start])
+        parts.append(f'src="images/{filename}"')
+        position = search_from
+    parts.append(html_content[position:])
+    return ''.join(parts)
 
 def get_padded_id(value, prefix):
     if value and str(value).isdigit():
@@ -138,6 +1258,21 @@ def get_padded_id(value, prefix):
         padded_id = f"{prefix}-{value}"
     return padded_id
 
+def index_sibling_positions(file_elems):
+    # For every <File> in file_elems (document order), its 1-based position among the <File> children of its parent
+    # and the number of those children, so topic handlers don't have to findall()/index() per file
+    parents = [file_elem.getparent() for file_elem in file_elems]
+    counts = {}
+    positions = []
+    for parent_elem in parents:
+        counts[parent_elem] = counts.get(parent_elem, 0) + 1
+        positions.append(counts[parent_elem])
+    return [(position, counts[parent_elem]) for position, parent_elem in zip(positions, parents)]
+
+def is_listed_download(download_url, download_title):
+    # Downloads are only put into a Download page's list when they have both a URL and a title
+    return bool(download_url and download_title)
+
 def append_element_attributes(tree_elem, data_dict, prefix, output_dir='', file_id=''):
     for attr in tree_elem.attrib:
         field_name = f"{prefix}_{attr}"
@@ -154,42 +1289,472 @@ def append_child_element_values(tree_elem, data_dict, prefix, output_dir='', fil
             data_dict[field_name] = clean_value(child.text.strip(), output_dir, unique_id)
     return data_dict
 
-def process_xml_files(directory):
-    # Initialize data collections and fieldnames
-    data_collections = {
-        'Course': [],
-        'Expert': [],
-        'Section': [],
-        'Lesson': [],
-        'Topic': []
-    }
-    fieldnames = {
-        'Course': set(),
-        'Expert': set(),
-        'Section': set(),
-        'Lesson': set(),
-        'Topic': set()
-    }
+def iter_course_elements(xml_path, stream=False):
+    xml_file = os.path.basename(xml_path)
+    if not stream:
+        tree = ET.parse(xml_path)
+        root = tree.getroot()
+        if root.tag != 'Courses':
+            print(f"Warning: Skipping file '{xml_file}' because it does not contain a top-level <Courses> element.")
+            return
+        yield from root.findall('Course')
+        return
 
-    xml_files = sorted([f for f in os.listdir(directory) if f.lower().endswith('.xml')])
-    for xml_file in xml_files:
-        xml_path = os.path.join(directory, xml_file)
-        try:
-            tree = ET.parse(xml_path)
-            root = tree.getroot()
+    # Streaming mode: hand out each <Course> subtree as soon as its end tag has been read,
+    # then clear it and drop the already-processed siblings so that peak memory depends
+    # on the largest course rather than on the size of the whole export file.
+    root = None
+    for event, elem in ET.iterparse(xml_path, events=('start', 'end'), huge_tree=True):
+        if root is None:
+            root = elem
             if root.tag != 'Courses':
                 print(f"Warning: Skipping file '{xml_file}' because it does not contain a top-level <Courses> element.")
-                continue
-            for course in root.findall('Course'):
-                # Begin processing courses
-                process_course(course, data_collections, fieldnames, directory)
-        except ET.ParseError as e:
-            print(f"Error parsing '{xml_file}': {e}")
+                return
             continue
+        if event == 'end' and elem.tag == 'Course' and elem.getparent() is root:
+            yield elem
+            elem.clear()
+            while elem.getprevious() is not None:
+                del root[0]
+
+def process_xml_file(xml_path, data_collections, fieldnames, directory, stream=False):
+    count_stat('xml_files')
+    try:
+        courses = iter_course_elements(xml_path, stream)
+        while True:
+            # Time spent waiting for the next <Course> is XML parsing (all of it up front without --stream)
+            course = run_timed('xml_parse', next, courses, None)
+            if course is None:
+                break
+            # Begin processing courses
+            process_course(course, data_collections, fieldnames, directory)
+            if 'v1' in output_profiles:
+                run_timed('v1_profile', collect_v1_rows, course, data_collections)
+    except ET.ParseError as e:
+        print(f"Error parsing '{os.path.basename(xml_path)}': {e}")
+
+class SpilledRowList:
+    # List-like row collection that writes rows to temporary JSON-lines segment files as they are
+    # appended instead of keeping them in memory. Iterating reads the rows back in insertion order,
+    # one at a time, so write_csv_files can stream them into the final CSV.
+    def __init__(self, spill_dir, name, segment_rows=100000):
+        self.spill_dir = spill_dir
+        self.name = name
+        self.segment_rows = segment_rows
+        self.segments = []
+        self.handle = None
+        self.segment_row_count = 0
+        self.row_count = 0
+
+    def append(self, row):
+        if self.handle is None or self.segment_row_count >= self.segment_rows:
+            self.close()
+            segment_path = os.path.join(self.spill_dir, f"{self.name}_{len(self.segments):05d}.jsonl")
+            self.handle = open(segment_path, 'w', encoding='utf-8')
+            self.segments.append(segment_path)
+            self.segment_row_count = 0
+        self.handle.write(json.dumps(row, ensure_ascii=False))
+        self.handle.write('\n')
+        self.segment_row_count += 1
+        self.row_count += 1
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def __len__(self):
+        return self.row_count
+
+    def __iter__(self):
+        self.close()
+        for segment_path in self.segments:
+            with open(segment_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+
+class MissingField:
+    # Marks the slots of a compact row whose field the row doesn't have. It pickles as a reference to
+    # MISSING_FIELD, so rows sent back by worker processes still compare by identity.
+    def __reduce__(self):
+        return 'MISSING_FIELD'
+
+    def __repr__(self):
+        return 'MISSING_FIELD'
+
+MISSING_FIELD = MissingField()
+
+class RowSchema:
+    # Registry of an entity's field names, shared by all its compact rows: maps each interned field name
+    # to the slot that holds its value
+    def __init__(self):
+        self.fields = []
+        self.slots = {}
+
+    def slot_for(self, field):
+        slot = self.slots.get(field)
+        if slot is None:
+            if type(field) is str:
+                field = sys.intern(field)
+            slot = len(self.fields)
+            self.fields.append(field)
+            self.slots[field] = slot
+        return slot
+
+class CompactRowList:
+    # List-like in-memory row collection. Each row is stored as a tuple of values in the slot order of the
+    # entity's RowSchema instead of a dict with its own copy of the keys, and short string values (course,
+    # lesson and icon names, types, IDs) are interned per collection so repeated values are stored once.
+    # Iterating yields the rows as dicts again; write_csv_files reads the tuples directly with iter_values.
+    def __init__(self, name, intern_max_chars=200):
+        self.name = name
+        self.schema = RowSchema()
+        self.rows = []
+        self.values = {}
+        self.intern_max_chars = intern_max_chars
+
+    def append(self, row):
+        slot_for = self.schema.slot_for
+        values = self.values
+        compact = []
+        for field, value in row.items():
+            slot = slot_for(field)
+            if isinstance(value, str) and len(value) <= self.intern_max_chars:
+                value = values.setdefault(value, value)
+            if slot >= len(compact):
+                compact.extend([MISSING_FIELD] * (slot + 1 - len(compact)))
+            compact[slot] = value
+        self.rows.append(tuple(compact))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        fields = self.schema.fields
+        for row in self.rows:
+            yield {field: value for field, value in zip(fields, row) if value is not MISSING_FIELD}
+
+    def iter_values(self, fields, default=''):
+        # Yields every row as a list of the values of `fields`, with `default` for the fields a row doesn't have
+        width = len(self.schema.fields)
+        slots = [self.schema.slots.get(field, width) for field in fields]
+        padding = (MISSING_FIELD,) * (width + 1)
+        for row in self.rows:
+            if len(row) <= width:
+                row = row + padding[len(row):]
+            yield [default if row[slot] is MISSING_FIELD else row[slot] for slot in slots]
+
+def create_data_collections(spill_dir=None):
+    # Rows are kept in compact in-memory lists unless a spill directory is given
+    if spill_dir:
+        return {name: SpilledRowList(spill_dir, name) for name in get_collection_names()}
+    return {name: CompactRowList(name) for name in get_collection_names()}
+
+def close_data_collections(data_collections):
+    for data_list in data_collections.values():
+        if isinstance(data_list, SpilledRowList):
+            data_list.close()
+
+def initialize_worker(sanitizer, cache_settings, image_writer_settings, stats_enabled, profiles, skip_log_settings):
+    # Worker processes start from a fresh module state, so repeat the parent's sanitizer setup
+    set_html_sanitizer(sanitizer)
+    set_output_profiles(profiles)
+    configure_html_cache(*cache_settings)
+    configure_image_writer(*image_writer_settings)
+    configure_pipeline_stats(stats_enabled)
+    log_path, verbose, run_id = skip_log_settings
+    configure_skipped_topic_log(log_path, verbose, part=True, run_id=run_id)
+
+def convert_xml_file(xml_path, directory, stream=False):
+    # Worker entry point for --workers: converts a single XML file into its own row lists and fieldname sets.
+    # Statistics are collected in a PipelineStats of their own and returned, for the caller to merge.
+    global pipeline_stats
+    outer_stats = pipeline_stats
+    if outer_stats is not None:
+        pipeline_stats = PipelineStats()
+    try:
+        data_collections = create_data_collections()
+        fieldnames = {name: set() for name in get_collection_names()}
+        if html_clean_cache is not None:
+            html_clean_cache.reset_counters()
+        if skipped_topic_log is not None:
+            skipped_topic_log.reset_counters()
+        process_xml_file(xml_path, data_collections, fieldnames, directory, stream)
+        # The rows refer to the extracted images, so they have to be on disk before the rows are handed back
+        run_timed('image_flush', flush_image_writer)
+        cache_counters = None
+        if html_clean_cache is not None:
+            html_clean_cache.flush()
+            cache_counters = html_clean_cache.counters()
+        skipped_counts = None
+        if skipped_topic_log is not None:
+            # Part files are closed after every XML file, so the parent can read them at any time
+            if skipped_topic_log.part:
+                skipped_topic_log.close()
+            skipped_counts = skipped_topic_log.counters()
+        file_stats = pipeline_stats.as_dict() if pipeline_stats is not None else None
+    finally:
+        pipeline_stats = outer_stats
+    return data_collections, fieldnames, cache_counters, file_stats, skipped_counts
+
+def merge_converted_rows(data_collections, fieldnames, file_collections, file_fieldnames):
+    for name in get_collection_names():
+        for row in file_collections[name]:
+            data_collections[name].append(row)
+        fieldnames[name].update(file_fieldnames[name])
+
+def merge_counters(totals, counters):
+    for counter, value in counters.items():
+        totals[counter] = totals.get(counter, 0) + value
+
+def convert_xml_files(xml_paths, directory, stream=False, workers=1):
+    # Yields convert_xml_file results in the order of xml_paths
+    if workers > 1 and len(xml_paths) > 1:
+        # Files are converted independently in worker processes. executor.map returns the results
+        # in submission order, so merging them gives the same row order as a serial run.
+        # Each worker sets up its own sanitizer and HTML cleaning cache with the same settings as this process.
+        cache_settings = html_clean_cache.settings() if html_clean_cache is not None else (0,)
+        image_writer_settings = image_writer.settings() if image_writer is not None else (0,)
+        skip_log_settings = skipped_topic_log.worker_settings() if skipped_topic_log is not None else (None, True, None)
+        with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker,
+                                 initargs=(html_sanitizer_engine, cache_settings, image_writer_settings,
+                                           pipeline_stats is not None, output_profiles, skip_log_settings)) as executor:
+            yield from executor.map(convert_xml_file, xml_paths, repeat(directory), repeat(stream))
+    else:
+        for xml_path in xml_paths:
+            yield convert_xml_file(xml_path, directory, stream)
+
+# Incremental conversion (--incremental / --manifest-dir).
+# The manifest records each XML file's size, mtime and content hash together with the rows it produced,
+# which are stored as one JSON file per distinct XML content. Unchanged files reuse their stored rows;
+# new or changed files are converted again. Bump MANIFEST_VERSION whenever process_course changes the
+# rows it produces so that old manifests are discarded.
+MANIFEST_VERSION = 3
+MANIFEST_FILENAME = 'manifest.json'
+# Stored rows live in a subdirectory of the manifest directory that only this code writes to, named by the
+# sha256 of their XML file; pruning never touches anything else, even when --manifest-dir is a shared folder
+MANIFEST_ROWS_DIRNAME = 'rows'
+MANIFEST_ROWS_FILENAME_PATTERN = re.compile(r'^[0-9a-f]{64}\.json$')
+
+def get_manifest_settings_key():
+    # Stored rows are only valid for the converter and sanitizer settings that produced them
+    v1_rows = '+v1' if 'v1' in output_profiles else ''
+    return f"{MANIFEST_VERSION}{v1_rows}:{get_sanitizer_policy_key()}"
+
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def load_manifest(manifest_dir):
+    os.makedirs(manifest_dir, exist_ok=True)
+    settings_key = get_manifest_settings_key()
+    try:
+        with open(os.path.join(manifest_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+    if not isinstance(manifest, dict) or manifest.get('settings') != settings_key:
+        manifest = {'settings': settings_key, 'files': {}}
+    return manifest
+
+def save_manifest(manifest_dir, manifest, xml_paths):
+    # Forget files that are no longer in the directory and delete row files nobody refers to
+    xml_files = {os.path.basename(xml_path) for xml_path in xml_paths}
+    manifest['files'] = {name: entry for name, entry in manifest['files'].items() if name in xml_files}
+    rows_files = {entry['rows'] for entry in manifest['files'].values()}
+    rows_dir = os.path.join(manifest_dir, MANIFEST_ROWS_DIRNAME)
+    if os.path.isdir(rows_dir):
+        for filename in os.listdir(rows_dir):
+            if (MANIFEST_ROWS_FILENAME_PATTERN.match(filename)
+                    and f"{MANIFEST_ROWS_DIRNAME}/{filename}" not in rows_files):
+                os.remove(os.path.join(rows_dir, filename))
+    write_json_atomically(os.path.join(manifest_dir, MANIFEST_FILENAME), manifest)
+
+def write_json_atomically(path, data):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def find_manifest_entry(manifest, manifest_dir, xml_path, directory):
+    # Returns the manifest entry for xml_path if its stored rows can be reused, otherwise None
+    entry = manifest['files'].get(os.path.basename(xml_path))
+    if entry is None:
+        return None
+    stat = os.stat(xml_path)
+    if (entry['size'], entry['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+        # Copied or touched files are only converted again if their content changed
+        if entry['size'] != stat.st_size or entry['sha256'] != hash_file(xml_path):
+            return None
+        entry['mtime_ns'] = stat.st_mtime_ns
+    if not os.path.exists(os.path.join(manifest_dir, entry['rows'])):
+        return None
+    # Images extracted from base64 data by the earlier run have to still be there
+    for image_filename in entry['images']:
+        if not os.path.exists(os.path.join(directory, 'images', image_filename)):
+            return None
+    return entry
+
+def load_manifest_rows(manifest_dir, entry):
+    with open(os.path.join(manifest_dir, entry['rows']), 'r', encoding='utf-8') as f:
+        stored = json.load(f)
+    return stored['rows'], {name: set(names) for name, names in stored['fieldnames'].items()}
+
+def record_manifest_entry(manifest, manifest_dir, xml_path, directory, file_collections, file_fieldnames, skipped_counts=None):
+    stat = os.stat(xml_path)
+    sha = hash_file(xml_path)
+    rows = {name: list(file_collections[name]) for name in get_collection_names()}
+    images = set()
+    for data_list in rows.values():
+        for row in data_list:
+            for value in row.values():
+                if isinstance(value, str) and 'src="images/' in value:
+                    images.update(re.findall(r'src="images/([^"]+)"', value))
+    images = sorted(image for image in images if os.path.exists(os.path.join(directory, 'images', image)))
+    rows_filename = f"{MANIFEST_ROWS_DIRNAME}/{sha}.json"
+    os.makedirs(os.path.join(manifest_dir, MANIFEST_ROWS_DIRNAME), exist_ok=True)
+    write_json_atomically(os.path.join(manifest_dir, rows_filename), {
+        'rows': rows,
+        'fieldnames': {name: sorted(file_fieldnames[name]) for name in get_collection_names()},
+    })
+    manifest['files'][os.path.basename(xml_path)] = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha,
+        'rows': rows_filename,
+        'images': images,
+        'skipped': skipped_counts or {},
+    }
 
-    # After processing all XML files, write CSV files
-    write_csv_files(directory, data_collections, fieldnames)
+def process_xml_files(directory, stream=False, spill=False, spill_dir=None, workers=1, manifest_dir=None,
+                      stats_file=None, parquet=False, parquet_row_group=10000, sqlite_path=None, course_images=None,
+                      link_experts=False, delta_snapshot=None, media_check=None, wxr=None):
+    start_time = time.perf_counter()
+    # Temporary segment files live in their own directory, which is removed once the CSVs are written
+    row_spill_dir = tempfile.mkdtemp(prefix='skillify_rows_', dir=spill_dir) if spill or spill_dir else None
 
+    # Initialize data collections and fieldnames
+    data_collections = create_data_collections(row_spill_dir)
+    fieldnames = {name: set() for name in get_collection_names()}
+    images_dir = os.path.join(directory, 'images')
+    image_archive = None
+    if output_compression:
+        archive_path = os.path.join(directory, f"images.tar{COMPRESSION_EXTENSIONS[output_compression]}")
+        image_archive = ImageArchive(archive_path, output_compression)
+
+    try:
+        xml_files = sorted([f for f in os.listdir(directory) if f.lower().endswith('.xml')])
+        xml_paths = [os.path.join(directory, xml_file) for xml_file in xml_files]
+        cache_counters = {}
+        skipped_counts = {}
+        if manifest_dir:
+            manifest = load_manifest(manifest_dir)
+            entries = {xml_path: find_manifest_entry(manifest, manifest_dir, xml_path, directory) for xml_path in xml_paths}
+            changed_paths = [xml_path for xml_path in xml_paths if entries[xml_path] is None]
+            converted = convert_xml_files(changed_paths, directory, stream, workers)
+            # Merge stored and freshly converted rows in file order so the CSVs match a full rebuild
+            for xml_path in xml_paths:
+                if entries[xml_path] is not None:
+                    file_collections, file_fieldnames = load_manifest_rows(manifest_dir, entries[xml_path])
+                    merge_counters(skipped_counts, entries[xml_path].get('skipped', {}))
+                    count_stat('xml_files_reused')
+                else:
+                    file_collections, file_fieldnames, file_cache_counters, file_stats, file_skipped_counts = next(converted)
+                    if file_cache_counters:
+                        merge_counters(cache_counters, file_cache_counters)
+                    if file_stats:
+                        pipeline_stats.merge(file_stats)
+                    if file_skipped_counts:
+                        merge_counters(skipped_counts, file_skipped_counts)
+                    record_manifest_entry(manifest, manifest_dir, xml_path, directory, file_collections, file_fieldnames,
+                                          file_skipped_counts)
+                    if image_archive is not None:
+                        image_archive.add_new_images(images_dir)
+                merge_converted_rows(data_collections, fieldnames, file_collections, file_fieldnames)
+            save_manifest(manifest_dir, manifest, xml_paths)
+            print(f"Incremental run: converted {len(changed_paths)} of {len(xml_paths)} XML files, "
+                  f"reused stored rows for the rest.")
+        elif workers > 1 and len(xml_paths) > 1:
+            for file_collections, file_fieldnames, file_cache_counters, file_stats, file_skipped_counts in convert_xml_files(xml_paths, directory, stream, workers):
+                merge_converted_rows(data_collections, fieldnames, file_collections, file_fieldnames)
+                if file_cache_counters:
+                    merge_counters(cache_counters, file_cache_counters)
+                if file_stats:
+                    pipeline_stats.merge(file_stats)
+                if file_skipped_counts:
+                    merge_counters(skipped_counts, file_skipped_counts)
+                if image_archive is not None:
+                    image_archive.add_new_images(images_dir)
+        else:
+            if html_clean_cache is not None:
+                html_clean_cache.reset_counters()
+            if skipped_topic_log is not None:
+                skipped_topic_log.reset_counters()
+            for xml_path in xml_paths:
+                process_xml_file(xml_path, data_collections, fieldnames, directory, stream)
+                if image_archive is not None:
+                    image_archive.add_new_images(images_dir)
+            if html_clean_cache is not None:
+                html_clean_cache.flush()
+                cache_counters = html_clean_cache.counters()
+            if skipped_topic_log is not None:
+                skipped_counts = skipped_topic_log.counters()
+
+        if skipped_topic_log is not None:
+            skipped_topic_log.merge_parts()
+            print_skipped_topic_summary(skipped_counts, skipped_topic_log.path)
+        if cache_counters:
+            print_html_cache_summary(cache_counters)
+
+        # Wait for the background image writes before the CSVs that refer to them are written
+        run_timed('image_flush', flush_image_writer)
+        if image_archive is not None:
+            image_archive.close(images_dir)
+            image_archive = None
+        # An archive from an earlier run with another (or no) compression would be out of date
+        for extension in COMPRESSION_EXTENSIONS.values():
+            archive_variant = os.path.join(directory, f"images.tar{extension}")
+            if extension != COMPRESSION_EXTENSIONS.get(output_compression) and os.path.exists(archive_variant):
+                os.remove(archive_variant)
+
+        if link_experts:
+            run_timed('link_experts', link_expert_rows, data_collections, fieldnames)
+
+        # After processing all XML files, write CSV files
+        write_csv_files(directory, data_collections, fieldnames)
+        if delta_snapshot:
+            write_delta_files(directory, data_collections, fieldnames, delta_snapshot)
+        if parquet:
+            write_parquet_files(directory, data_collections, fieldnames, parquet_row_group)
+        if sqlite_path:
+            write_sqlite_database(sqlite_path, data_collections, fieldnames)
+        if wxr:
+            write_wxr_file(data_collections=data_collections, **wxr)
+        if course_images:
+            optimize_course_images(directory, data_collections['Course'], **course_images)
+        if media_check:
+            check_media_urls(directory, data_collections['Topic'], **media_check)
+
+        if pipeline_stats is not None:
+            pipeline_stats.add_time('total', time.perf_counter() - start_time)
+            report = pipeline_stats.as_dict()
+            report['rows'] = {name: len(data_collections[name]) for name in ENTITY_NAMES}
+            report['html_cache'] = cache_counters
+            report_path = stats_file or os.path.join(directory, 'pipeline_report.json')
+            write_pipeline_report(report_path, report)
+            print_pipeline_summary(report, report_path)
+    finally:
+        if image_archive is not None:
+            # The conversion failed; keep the previous archive instead of replacing it with a partial one
+            image_archive.close(images_dir, complete=False)
+        close_data_collections(data_collections)
+        if row_spill_dir:
+            shutil.rmtree(row_spill_dir, ignore_errors=True)
+
+@timed_stage('process_course')
 def process_course(course_elem, data_collections, fieldnames, directory):
     # Initialize course_order_counter
     global_order_counter = {'counter': 0}  # Use dict to pass by reference
@@ -335,6 +1900,7 @@ def process_course(course_elem, data_collections, fieldnames, directory):
 
                     # Get the list of descendant <File> elements
                     file_elems = section_elem.findall('.//File')
+                    sibling_positions = index_sibling_positions(file_elems)
                     for topic_idx, file_elem in enumerate(file_elems):
                         global_order_counter['counter'] += 1  # Increment order
                         topic_id_padded = get_padded_id(str(topic_idx), "T")
@@ -381,23 +1947,21 @@ def process_course(course_elem, data_collections, fieldnames, directory):
                         # Initialize variables
                         topic_specific_data = {}
                         topic_type_not_configured = False
+                        skip_reason = "Topic skipped because topic type is not yet configured."
 
                         # Switch cases based on parent_elem's Type and ContentType attributes:
 
                         # Multimedia pages:
 
                         if parent_type == "1" and parent_contentType == "0":
-                            # Get and clean the description
-                            description = topic_data.get("File_Description", "").strip()
+                            # Get and clean the description (append_element_attributes usually has already)
+                            description = topic_data.get("File_Description", "")
                             if description:
                                 # Clean the description before concatenation
                                 description = clean_value(description, directory, topic_file_id)
                             else:
                                 description = ""
 
-                            # Initialize topic_body
-                            topic_body = description
-
                             # Collect all <Download> elements that are immediate children of parent_elem
                             download_elems = parent_elem.findall('Download')
                             downloads_html = ""
@@ -411,17 +1975,15 @@ def process_course(course_elem, data_collections, fieldnames, directory):
                                     download_url = topic_data.get(f"{download_prefix}_Url", "")
                                     download_name = topic_data.get(f"{download_prefix}_Name", "")
                                     download_title = topic_data.get(f"{download_prefix}_Title", "")
-                                    if download_url and download_title:
+                                    if is_listed_download(download_url, download_title):
                                         file_ext = os.path.splitext(download_url)[1].upper().lstrip('.')
                                         downloads_list.append(f'<li><a href="{download_url}" title="{download_name}" download>{download_title} ({file_ext})</a></li>')
                                 if downloads_list:
                                     downloads_html = "<ul>" + "".join(downloads_list) + "</ul>"
 
-                            # Concatenate description and downloads_html without extra whitespace
-                            topic_body = topic_body.strip() + downloads_html.strip()
-
-                            # Clean the entire topic_body
-                            topic_body = clean_html_content(topic_body)
+                            # Concatenate description and downloads_html without extra whitespace; only the
+                            # parts that haven't been sanitized yet (usually just the download list) are cleaned
+                            topic_body = join_sanitized_html(description, downloads_html)
 
                             topic_specific_data = {
                                 "Type": "Article",
@@ -501,9 +2063,7 @@ def process_course(course_elem, data_collections, fieldnames, directory):
 
                         elif parent_type == "1" and parent_contentType == "16":
                             # Multi-video page
-                            files_in_parent = parent_elem.findall('File')
-                            file_position = files_in_parent.index(file_elem) + 1
-                            file_count = len(files_in_parent)
+                            file_position, file_count = sibling_positions[topic_idx]
 
                             file_name = topic_data["File_Name"]
                             parent_name = clean_value(parent_elem.get("Name", ""), directory, topic_file_id)
@@ -613,8 +2173,7 @@ def process_course(course_elem, data_collections, fieldnames, directory):
                                 "TypeDescription": "Unknown",
                                 "FontAwesomeIcon": "stream"
                             }
-                            print(f"<File> element found directly within a {parent_elem_type} element.")
-                            print(json.dumps(topic_data, indent=2))
+                            skip_reason = f"<File> element found directly within a {parent_elem_type} element."
                             topic_type_not_configured = True
 
                         # Default case
@@ -626,9 +2185,17 @@ def process_course(course_elem, data_collections, fieldnames, directory):
                         topic_data.update(topic_specific_data)
                         fieldnames['Topic'].update(topic_data.keys())
 
+                        if pipeline_stats is not None:
+                            if topic_type_not_configured:
+                                pipeline_stats.count_topic(f"Not configured (Type {parent_type}, ContentType {parent_contentType})")
+                            else:
+                                pipeline_stats.count_topic(topic_specific_data['TypeDescription'])
+
                         if topic_type_not_configured:
-                            print("Topic skipped because topic type is not yet configured.")
-                            print(json.dumps(topic_data, indent=2))
+                            skipped_type = f"Type {parent_type}, ContentType {parent_contentType}"
+                            if topic_specific_data.get('TypeDescription'):
+                                skipped_type = f"{topic_specific_data['TypeDescription']} ({skipped_type})"
+                            record_skipped_topic(skip_reason, skipped_type, topic_data)
                         else:
                             # Add topic_data to collection
                             data_collections['Topic'].append(topic_data)
@@ -640,32 +2207,1207 @@ def process_course(course_elem, data_collections, fieldnames, directory):
     # Add course_data to data_collections
     data_collections['Course'].append(course_data)
 
+# Define the desired field order for all output files
+CORE_FIELD_ORDER = [
+    'Path', 'CourseID', 'SectionID', 'LessonID', 'TopicID', 'CourseOrder', 'Course', 'Lesson', 'SharedCourse', 'SharedLesson', 'Level', 
+    'Type', 'TypeDescription', 'FontAwesomeIcon', 'Title', 'Body',
+    'CourseImageOriginalFilename', 'CourseImageOptimizedFilename', 'CourseSections'
+]
+
+# Expert link table (--link-experts).
+# process_course writes an Expert row per course the expert appears in, each with the full Expert_Bio HTML.
+# With --link-experts the Expert table holds every distinct expert once, identified by a hash of its Expert_*
+# fields, and the CourseExpert table links the courses to them (Path and ExpertOrder are the per-course
+# values the Expert rows used to have).
+LINK_ENTITY_NAMES = ['CourseExpert']
+
+def get_output_entity_names(data_collections):
+    return ENTITY_NAMES + [name for name in LINK_ENTITY_NAMES if name in data_collections]
+
+def get_expert_id(expert_fields):
+    content = json.dumps(expert_fields, sort_keys=True, ensure_ascii=False)
+    return f"E-{hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]}"
+
+def link_expert_rows(data_collections, fieldnames):
+    experts = CompactRowList('Expert')
+    links = CompactRowList('CourseExpert')
+    expert_ids = set()
+    for expert_data in data_collections['Expert']:
+        expert_fields = {field: value for field, value in expert_data.items() if field not in ('Path', 'CourseID', 'ExpertID')}
+        expert_id = get_expert_id(expert_fields)
+        if expert_id not in expert_ids:
+            expert_ids.add(expert_id)
+            experts.append({'ExpertID': expert_id, **expert_fields})
+        links.append({
+            'Path': expert_data['Path'],
+            'CourseID': expert_data['CourseID'],
+            'ExpertID': expert_id,
+            'ExpertOrder': expert_data['ExpertID'],
+        })
+    data_collections['Expert'] = experts
+    data_collections['CourseExpert'] = links
+    fieldnames['Expert'] = (fieldnames['Expert'] - {'Path', 'CourseID'}) | {'ExpertID'}
+    fieldnames['CourseExpert'] = {'Path', 'CourseID', 'ExpertID', 'ExpertOrder'}
+    count_stat('experts_linked', len(links))
+    count_stat('experts_unique', len(experts))
+
+def get_ordered_fieldnames(entity_fieldnames):
+    # Core fields in their fixed order, followed by the additional dynamic fields sorted by name
+    specific_core_fields = [field for field in CORE_FIELD_ORDER if field in entity_fieldnames]
+    dynamic_fields = sorted(set(entity_fieldnames) - set(specific_core_fields))
+    return specific_core_fields + dynamic_fields
+
+# Output profiles (--profiles).
+# Each profile reproduces the columns of one converter version from the same parse:
+# - v4: all columns (Entity.csv).
+# - v3: without the Course/Lesson/SharedCourse/SharedLesson name columns v4 added.
+# - v2: like v3, and also without the CourseSections JSON.
+# - v1: the fixed headers of skillify_XML_to_learndash_CSV.py. v1 walks the course tree differently (one topic
+#   row per download, unsanitized values), so its rows are collected separately by running v1's process_course
+#   on each parsed <Course> element.
+# Profiles other than v4 are written next to the v4 files as Entity_<profile>.csv, so the image paths in the
+# HTML columns stay valid. skillify_XML_to_learndash_CSV.py is only imported when the v1 profile is used.
+V4_NAME_FIELDS = {'Course', 'Lesson', 'SharedCourse', 'SharedLesson'}
+
+def get_v1_converter():
+    import skillify_XML_to_learndash_CSV as v1_converter
+    return v1_converter
+
+def get_v1_csv_headers():
+    return get_v1_converter().CSV_HEADERS
+
+# fixed_fieldnames returns the headers of profiles whose columns don't depend on the rows
+OUTPUT_PROFILES = {
+    'v1': {'fixed_fieldnames': get_v1_csv_headers, 'dropped_fields': {}},
+    'v2': {'fixed_fieldnames': None, 'dropped_fields': {'Course': {'CourseSections'}, 'Lesson': V4_NAME_FIELDS, 'Topic': V4_NAME_FIELDS}},
+    'v3': {'fixed_fieldnames': None, 'dropped_fields': {'Lesson': V4_NAME_FIELDS, 'Topic': V4_NAME_FIELDS}},
+    'v4': {'fixed_fieldnames': None, 'dropped_fields': {}},
+}
+V1_COLLECTION_NAMES = {name: f"v1_{name}" for name in ENTITY_NAMES}
+
+output_profiles = ['v4']
+
+def set_output_profiles(profiles):
+    global output_profiles
+    unknown = [profile for profile in profiles if profile not in OUTPUT_PROFILES]
+    if unknown:
+        raise ValueError(f"Unknown output profile '{unknown[0]}'.")
+    output_profiles = [profile for profile in OUTPUT_PROFILES if profile in profiles]
+    if 'v1' in output_profiles:
+        # Fail before converting anything if the v1 script isn't there
+        get_v1_converter()
+
+def get_collection_names():
+    # The v1 profile needs rows of its own, collected next to the v4 rows
+    if 'v1' in output_profiles:
+        return ENTITY_NAMES + list(V1_COLLECTION_NAMES.values())
+    return ENTITY_NAMES
+
+class RowCollector:
+    # Stands in for the csv.DictWriter that v1's process_course writes to and keeps the rows instead
+    def __init__(self, data_list):
+        self.data_list = data_list
+
+    def writerow(self, row):
+        self.data_list.append(row)
+
+def collect_v1_rows(course_elem, data_collections):
+    csv_writers = {name: {'writer': RowCollector(data_collections[collection_name])}
+                   for name, collection_name in V1_COLLECTION_NAMES.items()}
+    get_v1_converter().process_course(course_elem, csv_writers)
+
+def get_profile_csv_path(directory, profile, name):
+    if profile == 'v4':
+        return os.path.join(directory, f"{name}.csv")
+    return os.path.join(directory, f"{name}_{profile}.csv")
+
+# Compressed output (--compress gzip|zstd).
+# The CSVs are written through a streaming compressor (Entity.csv.gz / Entity.csv.zst), and the images folder is
+# packed into a single compressed tar stream (images.tar.gz / images.tar.zst) as the images are produced: after
+# each converted XML file, the images that have been written since are appended to the archive. The images
+# folder itself stays in place, as incremental runs and the image deduplication look for files there.
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+output_compression = None
+
+def set_output_compression(compression):
+    global output_compression
+    if compression is not None and compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Unknown compression '{compression}'.")
+    output_compression = compression
+
+def open_compressed_output(path, compression, level=None):
+    # Binary write stream for path, compressed on the fly
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6 if level is None else level)
+    if compression == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=10 if level is None else level)
+        return compressor.stream_writer(open(path, 'wb'), closefd=True)
+    return open(path, 'wb')
+
+def get_csv_output_path(file_path):
+    # Where the CSV for file_path ends up, with the extension of the output compression
+    if output_compression is None:
+        return file_path
+    return file_path + COMPRESSION_EXTENSIONS[output_compression]
+
+def open_csv_output(output_path):
+    if output_compression is None:
+        return open(output_path, 'w', newline='', encoding='utf-8-sig')
+    stream = open_compressed_output(output_path, output_compression)
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+class ImageArchive:
+    # Tar stream of the images folder; add_new_images appends the images that aren't in it yet. The archive is
+    # written to a temporary file that replaces archive_path when it is closed complete, and is deleted otherwise.
+    def __init__(self, archive_path, compression):
+        self.archive_path = archive_path
+        self.temp_path = f"{archive_path}.tmp"
+        self.stream = open_compressed_output(self.temp_path, compression)
+        self.tar = tarfile.open(fileobj=self.stream, mode='w|')
+        self.packed = set()
+
+    def add_new_images(self, images_dir):
+        if not os.path.isdir(images_dir):
+            return
+        for entry in sorted(os.scandir(images_dir), key=lambda entry: entry.name):
+            # .part files are images the writer hasn't finished yet
+            if entry.name in self.packed or entry.name.endswith('.part') or not entry.is_file():
+                continue
+            self.tar.add(entry.path, arcname=f"images/{entry.name}")
+            self.packed.add(entry.name)
+
+    def close(self, images_dir, complete=True):
+        if complete:
+            self.add_new_images(images_dir)
+        self.tar.close()
+        self.stream.close()
+        if complete:
+            os.replace(self.temp_path, self.archive_path)
+        else:
+            os.remove(self.temp_path)
+
+@timed_stage('write_csv_files')
 def write_csv_files(directory, data_collections, fieldnames):
-    # Define the desired field order for all CSV files
-    core_field_order = [
-        'Path', 'CourseID', 'SectionID', 'LessonID', 'TopicID', 'CourseOrder', 'Course', 'Lesson', 'SharedCourse', 'SharedLesson', 'Level', 
-        'Type', 'TypeDescription', 'FontAwesomeIcon', 'Title', 'Body',
-        'CourseImageOriginalFilename', 'CourseImageOptimizedFilename', 'CourseSections'
-    ]
-
-    for name, data_list in data_collections.items():
-        if data_list:
-            file_path = os.path.join(directory, f"{name}.csv")
-            with open(file_path, 'w', newline='', encoding='utf-8-sig') as f:
+    for profile in output_profiles:
+        profile_settings = OUTPUT_PROFILES[profile]
+        entity_names = ENTITY_NAMES if profile_settings['fixed_fieldnames'] else get_output_entity_names(data_collections)
+        for name in entity_names:
+            if profile_settings['fixed_fieldnames']:
+                # Like v1 itself, write all five files with their fixed headers, even when they have no rows
+                data_list = data_collections[V1_COLLECTION_NAMES[name]]
+                all_fieldnames = profile_settings['fixed_fieldnames']()[name]
+            else:
+                data_list = data_collections[name]
+                if not data_list:
+                    continue
                 # Determine the fieldnames for this CSV
-                specific_core_fields = [field for field in core_field_order if field in fieldnames[name]]
-                # Collect additional dynamic fields
-                dynamic_fields = sorted(set(fieldnames[name]) - set(specific_core_fields))
-                all_fieldnames = specific_core_fields + dynamic_fields
+                dropped_fields = profile_settings['dropped_fields'].get(name, set())
+                all_fieldnames = get_ordered_fieldnames(fieldnames[name] - dropped_fields)
+            write_csv_file(get_profile_csv_path(directory, profile, name), data_list, all_fieldnames)
+
+def write_csv_file(file_path, data_list, all_fieldnames):
+    # The CSV is written to a temporary file that then replaces the old one, so readers never see a partial table
+    output_path = get_csv_output_path(file_path)
+    temp_path = f"{output_path}.tmp"
+    with open_csv_output(temp_path) as f:
+        write_csv_rows(f, data_list, all_fieldnames)
+    os.replace(temp_path, output_path)
+    # Drop the copy an earlier run wrote with another (or no) compression, so only the current table is left
+    for extension in [''] + list(COMPRESSION_EXTENSIONS.values()):
+        variant_path = file_path + extension
+        if variant_path != output_path and os.path.exists(variant_path):
+            os.remove(variant_path)
+
+def write_csv_rows(f, data_list, all_fieldnames):
+    if isinstance(data_list, CompactRowList):
+        # Compact rows are written straight from their slots, without building a dict per row
+        writer = csv.writer(f)
+        writer.writerow(all_fieldnames)
+        writer.writerows(data_list.iter_values(all_fieldnames))
+        return
 
-                writer = csv.DictWriter(f, fieldnames=all_fieldnames, extrasaction='ignore')
-                writer.writeheader()
+    writer = csv.DictWriter(f, fieldnames=all_fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    for data in data_list:
+        writer.writerow(data)
+
+# Delta export (--delta / --delta-snapshot).
+# Compares the rows of this run with a snapshot of the previous one, keyed by Path (ExpertID for the linked
+# Expert table) and a hash of each row's content, and writes the differences next to the full CSVs:
+# Entity_added.csv and Entity_changed.csv with the complete rows, Entity_removed.csv with the keys of the rows
+# that are gone. Delta files of a previous run are removed first, and entities without changes get no files.
+# The snapshot is replaced once the delta files are written; without a snapshot every row counts as added.
+DELTA_SNAPSHOT_VERSION = 1
+DELTA_KEY_FIELDS = ['Path', 'ExpertID']
+DELTA_KINDS = ['added', 'changed', 'removed']
+
+def get_delta_key(data):
+    for field in DELTA_KEY_FIELDS:
+        if field in data:
+            return field, data[field]
+    return None, None
+
+def get_row_hash(data):
+    content = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]
+
+def load_delta_snapshot(snapshot_path):
+    try:
+        with open(snapshot_path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get('version') != DELTA_SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+def remove_delta_files(directory, name):
+    for kind in DELTA_KINDS:
+        for extension in [''] + list(COMPRESSION_EXTENSIONS.values()):
+            path = os.path.join(directory, f"{name}_{kind}.csv{extension}")
+            if os.path.exists(path):
+                os.remove(path)
+
+@timed_stage('write_delta_files')
+def write_delta_files(directory, data_collections, fieldnames, snapshot_path):
+    snapshot = load_delta_snapshot(snapshot_path)
+    previous_entities = snapshot['entities'] if snapshot else {}
+    new_entities = {}
+    summary = []
+    for name in ENTITY_NAMES + LINK_ENTITY_NAMES:
+        remove_delta_files(directory, name)
+    for name in get_output_entity_names(data_collections):
+        previous = previous_entities.get(name, {'key': None, 'rows': {}})
+        previous_rows = previous['rows']
+        current_rows = {}
+        added = CompactRowList(f"{name}_added")
+        changed = CompactRowList(f"{name}_changed")
+        key_field = None
+        for data in data_collections[name]:
+            key_field, key = get_delta_key(data)
+            if key is None:
+                continue
+            row_hash = get_row_hash(data)
+            current_rows[key] = row_hash
+            previous_hash = previous_rows.get(key)
+            if previous_hash is None:
+                added.append(data)
+            elif previous_hash != row_hash:
+                changed.append(data)
+        if previous_rows and key_field != previous['key']:
+            # The key changed (Expert with or without --link-experts), so every stored row is replaced
+            removed_keys = list(previous_rows)
+            added = CompactRowList(f"{name}_added")
+            changed = CompactRowList(f"{name}_changed")
+            for data in data_collections[name]:
+                if get_delta_key(data)[1] is not None:
+                    added.append(data)
+        else:
+            removed_keys = [key for key in previous_rows if key not in current_rows]
+        removed = CompactRowList(f"{name}_removed")
+        for key in removed_keys:
+            removed.append({previous['key']: key})
+        new_entities[name] = {'key': key_field, 'rows': current_rows}
+
+        all_fieldnames = get_ordered_fieldnames(fieldnames[name])
+        for kind, delta_rows, delta_fieldnames in (('added', added, all_fieldnames), ('changed', changed, all_fieldnames),
+                                                   ('removed', removed, [previous['key']])):
+            if delta_rows:
+                write_csv_file(os.path.join(directory, f"{name}_{kind}.csv"), delta_rows, delta_fieldnames)
+        summary.append(f"{name} +{len(added)} ~{len(changed)} -{len(removed)}")
+
+    # Entities that were written last time but not this time (e.g. CourseExpert without --link-experts)
+    for name, previous in previous_entities.items():
+        if name not in new_entities and previous['rows']:
+            write_csv_file(os.path.join(directory, f"{name}_removed.csv"),
+                           [{previous['key']: key} for key in previous['rows']], [previous['key']])
+            summary.append(f"{name} +0 ~0 -{len(previous['rows'])}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(snapshot_path)), exist_ok=True)
+    write_json_atomically(snapshot_path, {'version': DELTA_SNAPSHOT_VERSION, 'entities': new_entities})
+    baseline = "previous run" if snapshot else "empty snapshot"
+    print(f"Delta against the {baseline}: {', '.join(summary)}.")
+
+# Parquet output (--parquet).
+# Same tables and column order as the CSVs, with CourseOrder and Level as integers, Type and FontAwesomeIcon as
+# dictionary-encoded (categorical) strings and every other column as a string. The schema depends on the dynamic
+# columns of all rows, so the files are written once conversion is done, streaming the rows from the row store
+# in row groups of parquet_row_group rows; with --spill only one row group is held in memory at a time.
+INTEGER_FIELDS = {'CourseOrder', 'Level'}
+PARQUET_CATEGORICAL_FIELDS = {'Type', 'FontAwesomeIcon'}
+
+def get_parquet_schema(all_fieldnames):
+    fields = []
+    for field in all_fieldnames:
+        if field in INTEGER_FIELDS:
+            fields.append(pa.field(field, pa.int64()))
+        elif field in PARQUET_CATEGORICAL_FIELDS:
+            fields.append(pa.field(field, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(field, pa.string()))
+    return pa.schema(fields)
+
+def get_parquet_value(field, value):
+    if value is None or value == '':
+        return None
+    if field in INTEGER_FIELDS:
+        return int(value)
+    return value if isinstance(value, str) else str(value)
+
+def write_parquet_row_group(writer, schema, columns):
+    arrays = [pa.array(values, type=schema.field(field).type) for field, values in columns.items()]
+    writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+@timed_stage('write_parquet_files')
+def write_parquet_files(directory, data_collections, fieldnames, row_group_size=10000):
+    for name in get_output_entity_names(data_collections):
+        data_list = data_collections[name]
+        if data_list:
+            file_path = os.path.join(directory, f"{name}.parquet")
+            all_fieldnames = get_ordered_fieldnames(fieldnames[name])
+            schema = get_parquet_schema(all_fieldnames)
+            temp_path = f"{file_path}.tmp"
+            with pq.ParquetWriter(temp_path, schema) as writer:
+                columns = {field: [] for field in all_fieldnames}
+                batch_rows = 0
                 for data in data_list:
-                    writer.writerow(data)
+                    for field, values in columns.items():
+                        values.append(get_parquet_value(field, data.get(field)))
+                    batch_rows += 1
+                    if batch_rows >= row_group_size:
+                        write_parquet_row_group(writer, schema, columns)
+                        columns = {field: [] for field in all_fieldnames}
+                        batch_rows = 0
+                if batch_rows:
+                    write_parquet_row_group(writer, schema, columns)
+            os.replace(temp_path, file_path)
+
+# SQLite output (--sqlite).
+# One table per entity. Fields that every row of the entity has become columns (CourseOrder and Level as
+# INTEGER, the rest as TEXT, in the CSV column order); fields that only some rows have, such as Download3_Url or
+# the Settings_* attributes, are stored together as a JSON object in the Extra column. Rows are inserted in
+# batches and the Path and ID columns are indexed once the rows are in. All tables are replaced in a single
+# transaction, so readers of the database see either the previous run's tables or the new ones.
+SQLITE_INDEXED_FIELDS = ['Path', 'CourseID', 'SectionID', 'LessonID', 'ExpertID']
+SQLITE_BATCH_ROWS = 5000
+
+def quote_sqlite_name(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def get_sqlite_value(field, value):
+    if field in INTEGER_FIELDS and value not in (None, ''):
+        return int(value)
+    return value
+
+def get_sqlite_columns(data_list, entity_fieldnames):
+    # Split the fields into those present on every row and the sparse ones that go into the Extra column
+    field_counts = {}
+    row_count = 0
+    for data in data_list:
+        row_count += 1
+        for field in data:
+            field_counts[field] = field_counts.get(field, 0) + 1
+    all_fieldnames = get_ordered_fieldnames(entity_fieldnames)
+    columns = [field for field in all_fieldnames if field_counts.get(field) == row_count]
+    extra_fields = [field for field in all_fieldnames if field_counts.get(field, 0) < row_count]
+    return columns, extra_fields
+
+@timed_stage('write_sqlite_database')
+def write_sqlite_database(db_path, data_collections, fieldnames):
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        connection.execute("BEGIN")
+        # Link tables from an earlier run are dropped too when they aren't written this time
+        for name in ENTITY_NAMES + LINK_ENTITY_NAMES:
+            data_list = data_collections.get(name)
+            table = quote_sqlite_name(name)
+            connection.execute(f"DROP TABLE IF EXISTS {table}")
+            if not data_list:
+                continue
+            columns, extra_fields = get_sqlite_columns(data_list, fieldnames[name])
+            column_definitions = [
+                f"{quote_sqlite_name(field)} {'INTEGER' if field in INTEGER_FIELDS else 'TEXT'}" for field in columns
+            ]
+            column_definitions.append('"Extra" TEXT')
+            connection.execute(f"CREATE TABLE {table} ({', '.join(column_definitions)})")
+
+            insert = (f"INSERT INTO {table} ({', '.join(quote_sqlite_name(field) for field in columns)}, \"Extra\") "
+                      f"VALUES ({', '.join('?' * (len(columns) + 1))})")
+            batch = []
+            for data in data_list:
+                extra = {field: data[field] for field in extra_fields if field in data}
+                values = [get_sqlite_value(field, data[field]) for field in columns]
+                values.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+                batch.append(values)
+                if len(batch) >= SQLITE_BATCH_ROWS:
+                    connection.executemany(insert, batch)
+                    batch = []
+            if batch:
+                connection.executemany(insert, batch)
+
+            for field in SQLITE_INDEXED_FIELDS:
+                if field in columns:
+                    connection.execute(f"CREATE INDEX {quote_sqlite_name(f'idx_{name}_{field}')} ON {table} ({quote_sqlite_name(field)})")
+        connection.execute("COMMIT")
+    except BaseException:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+# WordPress WXR output (--wxr).
+# Writes the courses as a WordPress eXtended RSS file that the WordPress importer loads in one pass, instead of
+# going through a CSV importer plugin. The file is streamed with lxml's incremental xmlfile writer, building one
+# <item> at a time. Courses become sfwd-courses posts with the CourseSections JSON as their course_sections meta
+# (Skillify lessons are LearnDash section headings, not posts), Skillify sections become sfwd-lessons and files
+# sfwd-topic posts; experts are not exported. All courses are written first, then the lessons, then the topics,
+# so parents always come before their children. The hierarchy from the Path is kept in post_parent and in
+# LearnDash's course_id / lesson_id / ld_course_<id> meta, and CourseOrder becomes the menu_order. Post IDs are
+# numbered from --wxr-first-id in that order. The importer keeps an ID when no post has it yet, so the range should
+# be clear of existing posts; otherwise the meta will refer to the wrong posts.
+WXR_VERSION = '1.2'
+WXR_NAMESPACES = {
+    'excerpt': 'http://wordpress.org/export/1.2/excerpt/',
+    'content': 'http://purl.org/rss/1.0/modules/content/',
+    'wfw': 'http://wellformedweb.org/CommentAPI/',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'wp': 'http://wordpress.org/export/1.2/',
+}
+WXR_ITEM_NAMESPACES = {prefix: WXR_NAMESPACES[prefix] for prefix in ('excerpt', 'content', 'dc', 'wp')}
+# Entity -> (post type, title field, content field)
+WXR_POST_TYPES = {
+    'Course': ('sfwd-courses', 'Course_CourseName', 'Course_CourseSummary'),
+    'Lesson': ('sfwd-lessons', 'Section_Name', None),
+    'Topic': ('sfwd-topic', 'Title', 'Body'),
+}
+WXR_STATUSES = ['publish', 'draft', 'pending', 'private']
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+def wxr_tag(prefix, name):
+    return f"{{{WXR_NAMESPACES[prefix]}}}{name}"
+
+def add_wxr_child(parent, tag, value='', cdata=False):
+    child = ET.SubElement(parent, tag)
+    text = INVALID_XML_CHARS.sub('', str(value)) if value not in (None, '') else ''
+    # CDATA can't contain its own end marker; such values are written as escaped text instead
+    child.text = ET.CDATA(text) if cdata and text and ']]>' not in text else text
+    return child
+
+def write_wxr_text_element(xf, tag, text):
+    with xf.element(tag):
+        xf.write(text)
+
+def build_wxr_item(post, meta):
+    # Items carry the namespace declarations themselves because xmlfile serializes every element on its own
+    item = ET.Element('item', nsmap=WXR_ITEM_NAMESPACES)
+    add_wxr_child(item, 'title', post['title'])
+    add_wxr_child(item, wxr_tag('dc', 'creator'), post['author'], cdata=True)
+    add_wxr_child(item, 'guid', f"skillify:{post['path']}").set('isPermaLink', 'false')
+    add_wxr_child(item, 'description')
+    add_wxr_child(item, wxr_tag('content', 'encoded'), post['content'], cdata=True)
+    add_wxr_child(item, wxr_tag('excerpt', 'encoded'), '', cdata=True)
+    add_wxr_child(item, wxr_tag('wp', 'post_id'), post['id'])
+    add_wxr_child(item, wxr_tag('wp', 'post_date'), post['date'], cdata=True)
+    add_wxr_child(item, wxr_tag('wp', 'comment_status'), 'closed', cdata=True)
+    add_wxr_child(item, wxr_tag('wp', 'ping_status'), 'closed', cdata=True)
+    # An empty post_name lets WordPress make a unique slug from the title
+    add_wxr_child(item, wxr_tag('wp', 'post_name'), '', cdata=True)
+    add_wxr_child(item, wxr_tag('wp', 'status'), post['status'], cdata=True)
+    add_wxr_child(item, wxr_tag('wp', 'post_parent'), post['parent'])
+    add_wxr_child(item, wxr_tag('wp', 'menu_order'), post['menu_order'])
+    add_wxr_child(item, wxr_tag('wp', 'post_type'), post['type'], cdata=True)
+    add_wxr_child(item, wxr_tag('wp', 'post_password'), '', cdata=True)
+    add_wxr_child(item, wxr_tag('wp', 'is_sticky'), 0)
+    for key, value in meta:
+        postmeta = ET.SubElement(item, wxr_tag('wp', 'postmeta'))
+        add_wxr_child(postmeta, wxr_tag('wp', 'meta_key'), key, cdata=True)
+        add_wxr_child(postmeta, wxr_tag('wp', 'meta_value'), value, cdata=True)
+    return item
+
+def get_wxr_meta(name, data, post_ids):
+    # (meta key, value) pairs of one post; the parent's post ID comes first
+    meta = [('_skillify_path', data.get('Path', ''))]
+    if name == 'Course':
+        if data.get('CourseSections'):
+            meta.append(('course_sections', data['CourseSections']))
+        return 0, meta
+    course_post_id = post_ids.get(data.get('CourseID'))
+    if course_post_id is None:
+        return None, meta
+    meta += [('course_id', course_post_id), (f"ld_course_{course_post_id}", course_post_id)]
+    if name == 'Lesson':
+        return course_post_id, meta
+    lesson_post_id = post_ids.get(data.get('Path', '').rsplit('/', 1)[0])
+    if lesson_post_id is None:
+        return None, meta
+    meta.append(('lesson_id', lesson_post_id))
+    return lesson_post_id, meta
+
+@timed_stage('write_wxr_file')
+def write_wxr_file(wxr_path, data_collections, author='admin', status='draft', first_id=1000000):
+    temp_path = f"{wxr_path}.tmp"
+    post_date = time.strftime('%Y-%m-%d %H:%M:%S')
+    # Post IDs of the courses and lessons by Path, for the children that refer to them
+    post_ids = {}
+    next_id = first_id
+    counts = {name: 0 for name in WXR_POST_TYPES}
+    orphans = 0
+    with ET.xmlfile(temp_path, encoding='utf-8') as xf:
+        xf.write_declaration()
+        with xf.element('rss', {'version': '2.0'}, nsmap=WXR_NAMESPACES):
+            with xf.element('channel'):
+                write_wxr_text_element(xf, 'title', 'Skillify courses')
+                write_wxr_text_element(xf, 'description', 'Converted by skillify_XML_to_learndash_CSV_v4.py')
+                write_wxr_text_element(xf, wxr_tag('wp', 'wxr_version'), WXR_VERSION)
+                with xf.element(wxr_tag('wp', 'author')):
+                    write_wxr_text_element(xf, wxr_tag('wp', 'author_login'), author)
+                    write_wxr_text_element(xf, wxr_tag('wp', 'author_display_name'), author)
+
+                for name, (post_type, title_field, content_field) in WXR_POST_TYPES.items():
+                    for data in data_collections[name]:
+                        parent_id, meta = get_wxr_meta(name, data, post_ids)
+                        if parent_id is None:
+                            orphans += 1
+                            continue
+                        post = {
+                            'id': next_id,
+                            'type': post_type,
+                            'title': data.get(title_field, ''),
+                            'content': data.get(content_field, '') if content_field else '',
+                            'path': data.get('Path', ''),
+                            'parent': parent_id,
+                            'menu_order': data.get('CourseOrder', 0),
+                            'date': post_date,
+                            'author': author,
+                            'status': status,
+                        }
+                        if name != 'Topic':
+                            post_ids[post['path']] = next_id
+                        xf.write(build_wxr_item(post, meta))
+                        next_id += 1
+                        counts[name] += 1
+    os.replace(temp_path, wxr_path)
+    summary = ', '.join(f"{amount} {WXR_POST_TYPES[name][0]}" for name, amount in counts.items())
+    print(f"WXR file '{wxr_path}' written: {summary} (post IDs {first_id} to {next_id - 1}).")
+    if orphans:
+        print(f"  {orphans} rows without a parent course or lesson were left out.")
+
+# Course image optimization (--course-images).
+# Reads the original course images (CourseImageOriginalFilename) from a local directory, resizes them to the
+# configured widths and recompresses them in a process pool. The first width is written under the
+# CourseImageOptimizedFilename that process_course emits, every further width as <name>-<width>w<ext>, and with
+# --course-image-webp each of them also gets a .webp sibling. The output directory keeps the source hash and
+# settings each image was made from, so unchanged images are skipped on the next run.
+COURSE_IMAGE_SOURCES_FILENAME = '.course_image_sources.json'
+
+def get_course_image_outputs(optimized_filename, sizes, webp):
+    # (file name, width, Pillow format) of every file made from one original
+    stem, ext = os.path.splitext(optimized_filename)
+    image_format = Image.registered_extensions().get(ext.lower(), 'JPEG')
+    outputs = []
+    for index, width in enumerate(sizes):
+        sized_stem = stem if index == 0 else f"{stem}-{width}w"
+        outputs.append((f"{sized_stem}{ext}", width, image_format))
+        if webp and image_format != 'WEBP':
+            outputs.append((f"{sized_stem}.webp", width, 'WEBP'))
+    return outputs
+
+def optimize_course_image(source_path, output_dir, outputs, quality):
+    # Process pool entry point: writes every output of one original
+    with Image.open(source_path) as original:
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    for filename, width, image_format in outputs:
+        image = original.copy()
+        # Never upscale; keep the aspect ratio
+        image.thumbnail((width, width * 10), Image.LANCZOS)
+        save_options = {}
+        if image_format == 'JPEG':
+            if image.mode != 'RGB':
+                # JPEG has no alpha channel; flatten transparent images onto white
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                rgba = image.convert('RGBA')
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                image = background
+            save_options = {'quality': quality, 'optimize': True, 'progressive': True}
+        elif image_format == 'WEBP':
+            save_options = {'quality': quality, 'method': 6}
+        elif image_format == 'PNG':
+            save_options = {'optimize': True}
+        output_path = os.path.join(output_dir, filename)
+        temp_path = f"{output_path}.tmp"
+        image.save(temp_path, format=image_format, **save_options)
+        os.replace(temp_path, output_path)
+    return source_path
+
+@timed_stage('optimize_course_images')
+def optimize_course_images(directory, course_rows, source_dir, output_dir=None, sizes=(1200, 600), webp=False,
+                           quality=82, workers=None):
+    output_dir = output_dir or os.path.join(directory, 'course_images')
+    os.makedirs(output_dir, exist_ok=True)
+    sources_path = os.path.join(output_dir, COURSE_IMAGE_SOURCES_FILENAME)
+    try:
+        with open(sources_path, 'r', encoding='utf-8') as f:
+            recorded_sources = json.load(f)
+    except (OSError, ValueError):
+        recorded_sources = {}
+    settings_key = f"{list(sizes)}:{webp}:{quality}"
+
+    tasks = {}
+    missing = 0
+    for course_data in course_rows:
+        original_filename = course_data.get('CourseImageOriginalFilename')
+        optimized_filename = course_data.get('CourseImageOptimizedFilename')
+        if not original_filename or not optimized_filename or optimized_filename in tasks:
+            continue
+        source_path = os.path.join(source_dir, original_filename)
+        if not os.path.isfile(source_path):
+            missing += 1
+            continue
+        tasks[optimized_filename] = source_path
+
+    jobs = []
+    skipped = 0
+    for optimized_filename, source_path in tasks.items():
+        outputs = get_course_image_outputs(optimized_filename, sizes, webp)
+        source_sha = hash_file(source_path)
+        recorded = recorded_sources.get(optimized_filename)
+        if (recorded == {'source_sha256': source_sha, 'settings': settings_key}
+                and all(os.path.exists(os.path.join(output_dir, filename)) for filename, _, _ in outputs)):
+            skipped += 1
+            continue
+        jobs.append((optimized_filename, source_path, source_sha, outputs))
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(optimize_course_image, source_path, output_dir, outputs, quality): (optimized_filename, source_sha)
+            for optimized_filename, source_path, source_sha, outputs in jobs
+        }
+        for future, (optimized_filename, source_sha) in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                recorded_sources.pop(optimized_filename, None)
+                print(f"Error optimizing course image for '{optimized_filename}': {e}")
+                continue
+            recorded_sources[optimized_filename] = {'source_sha256': source_sha, 'settings': settings_key}
+    write_json_atomically(sources_path, recorded_sources)
+
+    print(f"Course images: optimized {len(jobs) - failed}, unchanged {skipped}, failed {failed}, "
+          f"originals not found in '{source_dir}': {missing}.")
+
+# Media URL check (--media-index / --media-url-prefix).
+# Checks the media URLs that process_course puts into topic bodies (video and caption sources, PDF links and
+# download lists) against an inventory of the media bucket, and lists the ones that don't exist in
+# missing_media.csv. The inventory is a local mirror of the bucket, a bucket listing (one key or URL per line, or
+# the output of `aws s3 ls --recursive`) or an index file written by skillify_media_index.py, which is the
+# sorted, deduplicated list of keys. It is loaded into a set, so each URL is checked in constant time. URLs and
+# inventory entries are compared by key: the URL path without the leading '/', after removing the
+# --media-url-prefix when the URL starts with it.
+MISSING_MEDIA_FILENAME = 'missing_media.csv'
+MISSING_MEDIA_FIELDNAMES = ['Path', 'TypeDescription', 'Field', 'Url']
+# URL fields that end up in the body, by topic type, as the field name prefixes of the *_Url attributes
+MEDIA_URL_TOPIC_FIELDS = {
+    'Download page': ('Download',),
+    'Video page': ('File', 'Track'),
+    'Multi-video page': ('File', 'Track'),
+    'PDF page': ('File',),
+}
+MEDIA_LISTING_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\s+\d+\s+(.+)$')
+MEDIA_INDEX_HEADER = '# Skillify media index'
+
+def get_media_key(url, url_prefix=''):
+    # Plain string slicing instead of urlsplit, which is several times slower on millions of URLs
+    if url_prefix and url.startswith(url_prefix):
+        key = url[len(url_prefix):]
+    else:
+        key = url
+        scheme_end = url.find('://')
+        if scheme_end != -1:
+            path_start = url.find('/', scheme_end + 3)
+            key = url[path_start:] if path_start != -1 else ''
+    key = key.partition('?')[0].partition('#')[0]
+    if '%' in key:
+        key = urllib.parse.unquote(key)
+    return key.lstrip('/')
+
+def load_media_index(source, url_prefix=''):
+    # Set of the media keys in a mirror directory, a bucket listing or an index file
+    keys = set()
+    if os.path.isdir(source):
+        for root, _, filenames in os.walk(source):
+            relative_root = os.path.relpath(root, source).replace(os.sep, '/')
+            prefix = '' if relative_root == '.' else f"{relative_root}/"
+            keys.update(prefix + filename for filename in filenames)
+        return keys
+    with open(source, 'r', encoding='utf-8') as f:
+        first_line = f.readline()
+        if first_line.startswith(MEDIA_INDEX_HEADER):
+            # Written by skillify_media_index.py: one normalized key per line
+            return set(f.read().splitlines())
+        f.seek(0)
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or line.startswith('PRE '):
+                continue
+            listing_match = MEDIA_LISTING_PATTERN.match(line)
+            if listing_match:
+                line = listing_match.group(1)
+            keys.add(get_media_key(line, url_prefix))
+    return keys
+
+def iter_media_urls(topic_rows):
+    # (row, field, url) of every media URL emitted in a topic body
+    for data in topic_rows:
+        field_prefixes = MEDIA_URL_TOPIC_FIELDS.get(data.get('TypeDescription'))
+        if not field_prefixes:
+            continue
+        for field, value in data.items():
+            if not value or not field.endswith('_Url') or not field.startswith(field_prefixes):
+                continue
+            if field.startswith('Download'):
+                download_prefix = field[:-len('_Url')]
+                if not is_listed_download(value, data.get(f"{download_prefix}_Title")):
+                    continue
+            yield data, field, value
+
+@timed_stage('check_media_urls')
+def check_media_urls(directory, topic_rows, index_source, url_prefix=''):
+    start_time = time.perf_counter()
+    media_index = load_media_index(index_source, url_prefix)
+    load_seconds = time.perf_counter() - start_time
+    known_urls = {}
+    missing = []
+    checked = 0
+    for data, field, url in iter_media_urls(topic_rows):
+        checked += 1
+        exists = known_urls.get(url)
+        if exists is None:
+            exists = known_urls[url] = get_media_key(url, url_prefix) in media_index
+        if not exists:
+            missing.append({'Path': data.get('Path', ''), 'TypeDescription': data.get('TypeDescription', ''),
+                            'Field': field, 'Url': url})
+
+    report_path = os.path.join(directory, MISSING_MEDIA_FILENAME)
+    for extension in [''] + list(COMPRESSION_EXTENSIONS.values()):
+        if os.path.exists(report_path + extension):
+            os.remove(report_path + extension)
+    if missing:
+        write_csv_file(report_path, missing, MISSING_MEDIA_FIELDNAMES)
+    missing_urls = sum(1 for exists in known_urls.values() if not exists)
+    print(f"Checked {checked} media URLs ({len(known_urls)} distinct) against {len(media_index)} assets in "
+          f"{time.perf_counter() - start_time:.2f}s (index loaded in {load_seconds:.2f}s): {missing_urls} distinct "
+          f"URLs missing in {len(missing)} places.")
+    if missing:
+        print(f"The topics that refer to missing media are listed in '{get_csv_output_path(report_path)}'.")
+
+# Pre-flight scan (--scan).
+# Streams through the XML files without cleaning HTML or extracting images and counts what a conversion would
+# process: courses, lessons, sections, files (topics) and embedded base64 images, plus the (Type, ContentType)
+# pairs of the files' parents. The file is read in chunks that are both searched for base64 image markers and
+# fed to a pull parser that only reports the elements the scan looks at, so the scan runs close to disk speed.
+SCAN_CHUNK_BYTES = 1024 * 1024
+SCAN_IMAGE_MARKER = b'data:image/'
+# Topic types of process_course's switch, by (Type, ContentType) of the <File>'s parent, and whether they are
+# converted (True) or fall into a "not yet configured" branch (False). Question types only exist for Type 2.
+SCAN_TOPIC_TYPES = {
+    ('1', '0'): ('Download page', True),
+    ('1', '1'): ('Audio page', False),
+    ('1', '2'): ('Image page', False),
+    ('1', '3'): ('Video page', True),
+    ('1', '5'): ('Slide page', False),
+    ('1', '6'): ('PDF page', True),
+    ('1', '11'): ('TXT page', False),
+    ('1', '16'): ('Multi-video page', True),
+    ('1', '20'): ('Activity page', False),
+    ('1', '22'): ('Code Activity page', False),
+    ('2', '2'): ('Single question page - Drag matching', True),
+    ('2', '4'): ('Single question page - Multiple choice', True),
+    ('2', '5'): ('Single question page - Multiple selection', True),
+    ('2', '7'): ('Single question page - True/false', True),
+    ('3', '1'): ('Test launch page', True),
+    ('4', '1'): ('File directly in a section', False),
+}
+# Default conversion cost per topic and per embedded image (seconds, one worker, bleach sanitizer, synthetic
+# export). A pipeline_report.json from an earlier --stats run in the same directory recalibrates them.
+SCAN_SECONDS_PER_TOPIC = 0.0023
+SCAN_SECONDS_PER_IMAGE = 0.0005
+
+def get_scan_attribute(elem, name):
+    # Same normalization clean_value applies to plain attribute values
+    value = elem.get(name)
+    return ' '.join(value.split()) if value else value
+
+def get_scan_section(file_elem):
+    for ancestor in file_elem.iterancestors():
+        if ancestor.tag == 'Section':
+            return ancestor
+        if ancestor.tag == 'Course':
+            return None
+    return None
+
+def scan_xml_file(xml_path, totals, topic_pairs):
+    parser = ET.XMLPullParser(events=('end',), tag=('Course', 'Lesson', 'Section', 'File'), huge_tree=True)
+    overlap = len(SCAN_IMAGE_MARKER) - 1
+    tail = b''
+    with open(xml_path, 'rb') as f:
+        while True:
+            chunk = f.read(SCAN_CHUNK_BYTES)
+            if not chunk:
+                break
+            totals['bytes'] += len(chunk)
+            # Markers split across two chunks are found in the carried-over tail
+            searched = tail + chunk
+            totals['base64_images'] += searched.count(SCAN_IMAGE_MARKER)
+            tail = searched[-overlap:]
+            parser.feed(chunk)
+            for _, elem in parser.read_events():
+                scan_element(elem, totals, topic_pairs)
+        parser.close()
+        for _, elem in parser.read_events():
+            scan_element(elem, totals, topic_pairs)
+
+def scan_element(elem, totals, topic_pairs):
+    parent_elem = elem.getparent()
+    if elem.tag == 'File':
+        if get_scan_section(elem) is not None:
+            totals['files'] += 1
+            pair = (get_scan_attribute(parent_elem, 'Type'), get_scan_attribute(parent_elem, 'ContentType'))
+            topic_pairs[pair] = topic_pairs.get(pair, 0) + 1
+        # The <File> attributes hold the bulk of the HTML and images and aren't needed any more
+        elem.clear(keep_tail=True)
+    elif elem.tag == 'Section':
+        if parent_elem is not None and parent_elem.tag == 'Lesson':
+            totals['sections'] += 1
+    elif elem.tag == 'Lesson':
+        if parent_elem is not None and parent_elem.tag == 'Lessons':
+            totals['lessons'] += 1
+    elif parent_elem is not None and parent_elem.getparent() is None:
+        if parent_elem.tag == 'Courses':
+            totals['courses'] += 1
+        # Drop the finished course and its predecessors so memory stays flat
+        elem.clear()
+        while elem.getprevious() is not None:
+            del parent_elem[0]
+
+def load_scan_calibration(directory):
+    # Scales the default costs so that they reproduce the total time of an earlier --stats run
+    report_path = os.path.join(directory, 'pipeline_report.json')
+    try:
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        topics = sum(report['topic_types'].values())
+        images = report['counters'].get('base64_images_written', 0) + report['counters'].get('base64_images_reused', 0)
+        seconds = report['stages']['total']['seconds']
+    except (OSError, ValueError, KeyError):
+        return 1.0, None
+    predicted = topics * SCAN_SECONDS_PER_TOPIC + images * SCAN_SECONDS_PER_IMAGE
+    if not predicted or not seconds:
+        return 1.0, None
+    return seconds / predicted, report_path
+
+def scan_xml_files(directory, workers=1):
+    xml_files = sorted([f for f in os.listdir(directory) if f.lower().endswith('.xml')])
+    totals = {'xml_files': len(xml_files), 'bytes': 0, 'courses': 0, 'lessons': 0, 'sections': 0, 'files': 0,
+              'base64_images': 0}
+    topic_pairs = {}
+    start_time = time.perf_counter()
+    for xml_file in xml_files:
+        try:
+            scan_xml_file(os.path.join(directory, xml_file), totals, topic_pairs)
+        except ET.ParseError as e:
+            print(f"Error parsing '{xml_file}': {e}")
+    elapsed = time.perf_counter() - start_time
+
+    megabytes = totals['bytes'] / 1024 / 1024
+    print(f"Scanned {totals['xml_files']} XML files ({megabytes:.1f} MB) in {elapsed:.2f}s "
+          f"({megabytes / elapsed if elapsed else 0:.0f} MB/s).")
+    print(f"  Courses: {totals['courses']}")
+    print(f"  Lessons (LearnDash sections): {totals['lessons']}")
+    print(f"  Sections (LearnDash lessons): {totals['sections']}")
+    print(f"  Files (LearnDash topics): {totals['files']}")
+    print(f"  Embedded base64 images: {totals['base64_images']}")
+
+    print("Topics by (Type, ContentType):")
+    not_configured = 0
+    for pair, amount in sorted(topic_pairs.items(), key=lambda item: (-item[1], str(item[0]))):
+        description, configured = SCAN_TOPIC_TYPES.get(pair, ('Unknown', False))
+        if not configured:
+            not_configured += amount
+            description += ' (not yet configured)'
+        print(f"  Type {pair[0]}, ContentType {pair[1]}: {amount:>8}  {description}")
+    print(f"  {not_configured} of {totals['files']} topics fall into a not yet configured branch and will be skipped.")
+
+    factor, report_path = load_scan_calibration(directory)
+    estimate = factor * (totals['files'] * SCAN_SECONDS_PER_TOPIC + totals['base64_images'] * SCAN_SECONDS_PER_IMAGE)
+    parallel = max(1, min(workers, len(xml_files)))
+    calibration = f"calibrated from '{report_path}'" if report_path else "default per-item costs"
+    print(f"Estimated conversion time: {estimate / parallel:.0f}s with {parallel} worker(s) ({calibration}).")
+
+# Watch mode (--watch).
+# Keeps running and converts the folder again whenever XML files are added, changed or removed. Changes are
+# picked up through inotify when inotify_simple is installed, and by polling the folder every --watch-poll
+# seconds otherwise; with inotify the folder is still rescanned every WATCH_RESCAN_SECONDS in case events are
+# missed (e.g. on network shares). A change is only converted once the XML files have stayed the same for
+# --watch-settle seconds, so exports that are still being copied in aren't read half-written. Every run is
+# incremental, converting only the new and changed files, and the output tables are replaced atomically.
+WATCH_RESCAN_SECONDS = 30
+WATCH_INOTIFY_FLAGS = ['CREATE', 'MODIFY', 'CLOSE_WRITE', 'MOVED_TO', 'MOVED_FROM', 'DELETE']
+
+def snapshot_xml_files(directory):
+    # {filename: (size, mtime_ns)} of the XML files in directory
+    snapshot = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith('.xml') and entry.is_file():
+                stat = entry.stat()
+                snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+def describe_xml_changes(previous, current):
+    added = sum(1 for name in current if name not in previous)
+    changed = sum(1 for name in current if name in previous and current[name] != previous[name])
+    removed = sum(1 for name in previous if name not in current)
+    return f"{added} added, {changed} changed, {removed} removed"
+
+class FolderWatcher:
+    # Waits for something to happen in a folder, through inotify when available and by polling otherwise
+    def __init__(self, directory, poll_seconds=1.0):
+        self.poll_seconds = poll_seconds
+        self.inotify = None
+        if INotify is not None:
+            try:
+                self.inotify = INotify()
+                watch_flags = 0
+                for flag in WATCH_INOTIFY_FLAGS:
+                    watch_flags |= getattr(inotify_flags, flag)
+                self.inotify.add_watch(directory, watch_flags)
+            except OSError:
+                # No inotify (not Linux) or no watches left
+                self.close()
+
+    def mode(self):
+        return 'inotify' if self.inotify is not None else f"polling every {self.poll_seconds:g}s"
+
+    def wait(self, timeout=None):
+        # Returns after an event, after timeout seconds (None: no limit) or, when polling, after poll_seconds
+        if self.inotify is None:
+            time.sleep(self.poll_seconds if timeout is None else min(timeout, self.poll_seconds))
+            return
+        timeout = WATCH_RESCAN_SECONDS if timeout is None else min(timeout, WATCH_RESCAN_SECONDS)
+        self.inotify.read(timeout=max(int(timeout * 1000), 1))
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+def run_watched_conversion(convert):
+    # Every run starts with fresh stats and an empty skip log, like a separate invocation of the converter
+    configure_pipeline_stats(pipeline_stats is not None)
+    if skipped_topic_log is not None:
+        configure_skipped_topic_log(*skipped_topic_log.settings())
+    start_time = time.perf_counter()
+    try:
+        convert()
+    except Exception as e:
+        # Keep watching; the file is converted again once it changes
+        print(f"Conversion failed: {e!r}")
+        return
+    print(f"Conversion finished in {time.perf_counter() - start_time:.1f}s.")
+
+def watch_directory(directory, convert, settle_seconds=2.0, poll_seconds=1.0):
+    watcher = FolderWatcher(directory, poll_seconds)
+    print(f"Watching '{directory}' for XML files ({watcher.mode()}); press Ctrl+C to stop.")
+    converted_snapshot = None
+    snapshot = snapshot_xml_files(directory)
+    changed_at = time.monotonic()
+    try:
+        while True:
+            if snapshot == converted_snapshot:
+                watcher.wait()
+            else:
+                remaining = settle_seconds - (time.monotonic() - changed_at)
+                if remaining <= 0:
+                    if converted_snapshot is None:
+                        print(f"{time.strftime('%H:%M:%S')} Converting {len(snapshot)} XML files.")
+                    else:
+                        print(f"{time.strftime('%H:%M:%S')} XML files {describe_xml_changes(converted_snapshot, snapshot)}; converting.")
+                    run_watched_conversion(convert)
+                    # Changes made while converting differ from this snapshot and start the next run
+                    converted_snapshot = snapshot
+                    continue
+                watcher.wait(remaining)
+            current = snapshot_xml_files(directory)
+            if current != snapshot:
+                snapshot = current
+                changed_at = time.monotonic()
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        watcher.close()
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Convert Skillify XML course exports into LearnDash CSV files.")
+    parser.add_argument('directory', nargs='?', help="Directory containing the XML files (prompted for if omitted).")
+    parser.add_argument('--stream', action='store_true',
+                        help="Read each XML file incrementally with iterparse instead of loading the whole tree into memory.")
+    parser.add_argument('--spill', action='store_true',
+                        help="Write converted rows to temporary files on disk instead of holding them in memory until the CSVs are written.")
+    parser.add_argument('--spill-dir', metavar='DIR',
+                        help="Directory for the temporary row files (implies --spill; defaults to the system temp directory).")
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help="Convert the XML files in N worker processes (default: 1).")
+    parser.add_argument('--html-cache-size', type=int, default=10000, metavar='N',
+                        help="Number of sanitized HTML values kept in the in-memory cache (0 disables it; default: 10000).")
+    parser.add_argument('--html-cache-db', metavar='PATH',
+                        help="SQLite file that keeps sanitized HTML between runs.")
+    parser.add_argument('--html-cache-max-mb', type=int, default=256, metavar='MB',
+                        help="Size limit of the SQLite HTML cache before old entries are evicted (default: 256).")
+    parser.add_argument('--image-writers', type=int, default=4, metavar='N',
+                        help="Threads that write extracted images in the background (0 writes them inline; default: 4).")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only convert XML files that are new or changed since the last incremental run and reuse the stored rows for the rest.")
+    parser.add_argument('--manifest-dir', metavar='DIR',
+                        help="Directory for the manifest and stored rows (implies --incremental; defaults to .skillify_manifest in the XML directory).")
+    parser.add_argument('--stats', action='store_true',
+                        help="Time the pipeline stages, count topics per type and write a JSON report.")
+    parser.add_argument('--stats-file', metavar='PATH',
+                        help="Where to write the JSON report (implies --stats; defaults to pipeline_report.json in the XML directory).")
+    parser.add_argument('--parquet', action='store_true',
+                        help="Also write the five tables as typed Parquet files next to the CSVs (requires pyarrow).")
+    parser.add_argument('--parquet-row-group', type=int, default=10000, metavar='N',
+                        help="Rows per Parquet row group (default: 10000).")
+    parser.add_argument('--sqlite', metavar='PATH',
+                        help="Also write the five tables to an indexed SQLite database at PATH (existing tables are replaced).")
+    parser.add_argument('--wxr', metavar='PATH',
+                        help="Also write the courses, lessons and topics as a WordPress WXR file for the WordPress importer.")
+    parser.add_argument('--wxr-author', default='admin', metavar='LOGIN',
+                        help="WordPress user the WXR posts are attributed to (default: admin).")
+    parser.add_argument('--wxr-status', choices=WXR_STATUSES, default='draft',
+                        help="Post status of the WXR posts (default: draft).")
+    parser.add_argument('--wxr-first-id', type=int, default=1000000, metavar='ID',
+                        help="Post ID of the first WXR post; the rest are numbered on from it (default: 1000000).")
+    parser.add_argument('--profiles', nargs='+', choices=list(OUTPUT_PROFILES), default=['v4'], metavar='PROFILE',
+                        help="CSV column sets to write from the same parse: v1, v2, v3 and/or v4 (default: v4). "
+                             "v4 writes Entity.csv, the others Entity_<profile>.csv.")
+    parser.add_argument('--scan', action='store_true',
+                        help="Only count courses, lessons, sections, files and embedded images, show the topic types and "
+                             "estimate the conversion time; nothing is written.")
+    parser.add_argument('--skip-log', metavar='PATH',
+                        help="JSON-lines log of the topics skipped because their type is not yet configured "
+                             "(defaults to skipped_topics.jsonl in the XML directory).")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="Also print every skipped topic to the console as it is found.")
+    parser.add_argument('--course-images', metavar='DIR',
+                        help="Directory with the original course images; resize and recompress them into the "
+                             "CourseImageOptimizedFilename files (requires Pillow).")
+    parser.add_argument('--course-images-out', metavar='DIR',
+                        help="Where to write the optimized course images (defaults to course_images in the XML directory).")
+    parser.add_argument('--course-image-sizes', type=int, nargs='+', default=[1200, 600], metavar='WIDTH',
+                        help="Maximum widths to produce; the first one gets the plain optimized file name (default: 1200 600).")
+    parser.add_argument('--course-image-quality', type=int, default=82, metavar='Q',
+                        help="JPEG/WebP quality of the optimized course images (default: 82).")
+    parser.add_argument('--course-image-webp', action='store_true',
+                        help="Also write a .webp version of every optimized course image.")
+    parser.add_argument('--course-image-workers', type=int, metavar='N',
+                        help="Processes for the course image optimization (default: one per CPU).")
+    parser.add_argument('--link-experts', action='store_true',
+                        help="Write every distinct expert once to Expert.csv and link them to their courses in CourseExpert.csv.")
+    parser.add_argument('--compress', choices=sorted(COMPRESSION_EXTENSIONS),
+                        help="Write the CSVs compressed (.csv.gz / .csv.zst) and pack the images folder into "
+                             "images.tar.gz / images.tar.zst as the images are produced (zstd requires zstandard).")
+    parser.add_argument('--delta', action='store_true',
+                        help="Also write Entity_added/_changed/_removed.csv with the rows that differ from the previous --delta run.")
+    parser.add_argument('--delta-snapshot', metavar='PATH',
+                        help="Snapshot of the previous run's rows (implies --delta; defaults to .skillify_snapshot.json in the XML directory).")
+    parser.add_argument('--media-index', metavar='PATH',
+                        help="Check the media URLs in the topics against a local mirror of the media bucket, a bucket "
+                             "listing or an index from skillify_media_index.py, and list missing assets in missing_media.csv.")
+    parser.add_argument('--media-url-prefix', default='', metavar='URL',
+                        help="Part of the media URLs to remove to get the bucket key (default: the URL path is the key).")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and convert the new and changed XML files whenever the folder changes "
+                             "(implies --incremental; uses inotify_simple when installed, polling otherwise).")
+    parser.add_argument('--watch-settle', type=float, default=2.0, metavar='SECONDS',
+                        help="How long the XML files have to stay unchanged before a change is converted (default: 2).")
+    parser.add_argument('--watch-poll', type=float, default=1.0, metavar='SECONDS',
+                        help="Polling interval when inotify isn't available (default: 1).")
+    parser.add_argument('--sanitizer', choices=sorted(HTML_SANITIZER_ENGINES), default='bleach',
+                        help="HTML sanitizer engine: 'bleach' (BeautifulSoup + bleach, the default) or 'single-pass' "
+                             "(one html.parser pass producing the same output, except that a '<' inside <script> or <style> "
+                             "text is kept as '&lt;' instead of starting a tag; see skillify_sanitizer_check.py).")
+    return parser.parse_args()
 
 def main():
-    directory = get_directory()
-    process_xml_files(directory)
+    args = parse_arguments()
+    if args.parquet and pa is None:
+        print("--parquet needs the pyarrow package (pip install pyarrow).")
+        sys.exit(1)
+    if args.compress == 'zstd' and zstandard is None:
+        print("--compress zstd needs the zstandard package (pip install zstandard).")
+        sys.exit(1)
+    if args.course_images and Image is None:
+        print("--course-images needs the Pillow package (pip install Pillow).")
+        sys.exit(1)
+    if args.media_index and not os.path.exists(args.media_index):
+        print(f"The media index '{args.media_index}' does not exist.")
+        sys.exit(1)
+    directory = get_directory(args.directory)
+    if args.scan:
+        scan_xml_files(directory, workers=args.workers)
+        return
+    set_html_sanitizer(args.sanitizer)
+    try:
+        set_output_profiles(args.profiles)
+    except ImportError:
+        print("--profiles v1 needs skillify_XML_to_learndash_CSV.py next to this script.")
+        sys.exit(1)
+    set_output_compression(args.compress)
+    manifest_dir = args.manifest_dir
+    if (args.incremental or args.watch) and not manifest_dir:
+        manifest_dir = os.path.join(directory, '.skillify_manifest')
+    configure_html_cache(args.html_cache_size, args.html_cache_db, args.html_cache_max_mb * 1024 * 1024)
+    configure_image_writer(args.image_writers)
+    configure_pipeline_stats(args.stats or bool(args.stats_file))
+    configure_skipped_topic_log(args.skip_log or os.path.join(directory, 'skipped_topics.jsonl'), args.verbose)
+    delta_snapshot = args.delta_snapshot
+    if args.delta and not delta_snapshot:
+        delta_snapshot = os.path.join(directory, '.skillify_snapshot.json')
+    course_images = None
+    if args.course_images:
+        course_images = {
+            'source_dir': args.course_images,
+            'output_dir': args.course_images_out,
+            'sizes': args.course_image_sizes,
+            'webp': args.course_image_webp,
+            'quality': args.course_image_quality,
+            'workers': args.course_image_workers,
+        }
+    wxr = None
+    if args.wxr:
+        wxr = {'wxr_path': args.wxr, 'author': args.wxr_author, 'status': args.wxr_status, 'first_id': args.wxr_first_id}
+    media_check = None
+    if args.media_index:
+        media_check = {'index_source': args.media_index, 'url_prefix': args.media_url_prefix}
+    convert = functools.partial(process_xml_files, directory, stream=args.stream, spill=args.spill,
+                                spill_dir=args.spill_dir, workers=args.workers, manifest_dir=manifest_dir,
+                                stats_file=args.stats_file, parquet=args.parquet, parquet_row_group=args.parquet_row_group,
+                                sqlite_path=args.sqlite, course_images=course_images, link_experts=args.link_experts,
+                                delta_snapshot=delta_snapshot, media_check=media_check, wxr=wxr)
+    try:
+        if args.watch:
+            watch_directory(directory, convert, args.watch_settle, args.watch_poll)
+        else:
+            convert()
+    finally:
+        configure_image_writer(0)
+        configure_html_cache(0)
+        skipped_topic_log.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,109 @@
+################################################################################################################################
+# End-to-end benchmark of the Skillify XML -> LearnDash CSV converters (v1 to v4) on synthetic exports.
+# 1. Generate a synthetic export per scale with skillify_synthetic_export.py (scale 1 = 5 courses in 2 XML files).
+# 2. For every converter and round, copy the XML files into a fresh directory and run the converter on it in its own
+#    process, feeding the directory to its prompt; only the conversion itself is timed.
+# 3. Print the fastest round per converter and scale, with the size of the output and the speed relative to v1.
+#
+# Usage: python skillify_converter_benchmark.py [--scales 10 100] [--versions v1 v2 v3 v4] [--rounds N]
+#                                               [--v4-args "--workers 4"] [--work-dir DIR]
+################################################################################################################################
+
+import os
+import sys
+import csv
+import time
+import shlex
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+import skillify_synthetic_export
+
+################################################################################################################################
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CONVERTERS = {
+    'v1': 'skillify_XML_to_learndash_CSV.py',
+    'v2': 'skillify_XML_to_learndash_CSV_v2.py',
+    'v3': 'skillify_XML_to_learndash_CSV_v3.py',
+    'v4': 'skillify_XML_to_learndash_CSV_v4.py',
+}
+
+def count_csv_rows(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+def run_converter(version, xml_dir, run_dir, extra_args):
+    # Returns the wall-clock time of one conversion, or None if the converter failed
+    if os.path.exists(run_dir):
+        shutil.rmtree(run_dir)
+    os.makedirs(run_dir)
+    for filename in os.listdir(xml_dir):
+        shutil.copy(os.path.join(xml_dir, filename), run_dir)
+
+    command = [sys.executable, os.path.join(SCRIPT_DIR, CONVERTERS[version])] + extra_args
+    start = time.perf_counter()
+    result = subprocess.run(command, input=f"{run_dir}\n", text=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        print(f"{version} failed with exit code {result.returncode}:\n{result.stderr[-2000:]}")
+        return None
+    return elapsed
+
+################################################################################################################################
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Time the Skillify XML -> LearnDash CSV converters on synthetic exports.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[10, 100], metavar='N',
+                        help="Export sizes relative to the generator defaults (default: 10 100).")
+    parser.add_argument('--versions', nargs='+', default=list(CONVERTERS), choices=list(CONVERTERS),
+                        help="Converters to run (default: all).")
+    parser.add_argument('--rounds', type=int, default=1, metavar='N',
+                        help="Runs per converter and scale; the fastest is reported (default: 1).")
+    parser.add_argument('--v4-args', default='', metavar='ARGS',
+                        help="Extra command-line options for v4, e.g. \"--workers 4 --sanitizer single-pass\".")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed for the synthetic exports (default: 1).")
+    parser.add_argument('--work-dir', metavar='DIR',
+                        help="Keep the generated exports and outputs in DIR instead of a temporary directory.")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='skillify_benchmark_')
+    results = []
+    try:
+        for scale in args.scales:
+            xml_dir = os.path.join(work_dir, f"scale_{scale}", 'xml')
+            if not os.path.isdir(xml_dir):
+                skillify_synthetic_export.generate_export(xml_dir, courses=5 * scale, xml_files=2 * scale, seed=args.seed)
+            xml_megabytes = sum(os.path.getsize(os.path.join(xml_dir, f)) for f in os.listdir(xml_dir)) / 1024 / 1024
+            print(f"Scale {scale}x: {xml_megabytes:.1f} MB of XML")
+
+            for version in args.versions:
+                extra_args = shlex.split(args.v4_args) if version == 'v4' else []
+                run_dir = os.path.join(work_dir, f"scale_{scale}", version)
+                timings = [run_converter(version, xml_dir, run_dir, extra_args) for _ in range(args.rounds)]
+                timings = [t for t in timings if t is not None]
+                if not timings:
+                    continue
+                topic_rows = count_csv_rows(os.path.join(run_dir, 'Topic.csv'))
+                results.append((scale, version, min(timings), topic_rows, xml_megabytes))
+                print(f"  {version}: {min(timings):.2f}s ({topic_rows} topic rows)")
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print(f"{'Scale':>6} {'Version':>8} {'Seconds':>9} {'MB/s':>7} {'vs v1':>7} {'Topics':>8}")
+    baselines = {scale: seconds for scale, version, seconds, _, _ in results if version == 'v1'}
+    for scale, version, seconds, topic_rows, xml_megabytes in results:
+        relative = f"{baselines[scale] / seconds:.2f}x" if scale in baselines else '-'
+        print(f"{scale:>6} {version:>8} {seconds:>9.2f} {xml_megabytes / seconds:>7.2f} {relative:>7} {topic_rows:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+################################################################################################################################
+# Builds the media inventory index that skillify_XML_to_learndash_CSV_v4.py --media-index checks media URLs against.
+# 1. Read the media keys from one or more sources: a local mirror of the media bucket (every file, by its path
+#    relative to the mirror) or a bucket listing (one key or URL per line, or the output of `aws s3 ls --recursive`).
+# 2. Write them deduplicated and sorted, one key per line, so the index is small, diffable and quick to load.
+#
+# Usage: python skillify_media_index.py SOURCE [SOURCE ...] --output media_index.txt [--url-prefix URL]
+################################################################################################################################
+
+import os
+import sys
+import time
+import argparse
+
+import skillify_XML_to_learndash_CSV_v4 as converter
+
+################################################################################################################################
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Build the media inventory index used by the converter's --media-index option.")
+    parser.add_argument('sources', nargs='+', metavar='SOURCE',
+                        help="Local mirror directory of the media bucket or bucket listing file.")
+    parser.add_argument('--output', required=True, metavar='PATH', help="Where to write the index.")
+    parser.add_argument('--url-prefix', default='', metavar='URL',
+                        help="Part of the URLs in a listing to remove to get the key (same as the converter's --media-url-prefix).")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    start_time = time.perf_counter()
+    keys = set()
+    for source in args.sources:
+        if not os.path.exists(source):
+            print(f"The source '{source}' does not exist.")
+            sys.exit(1)
+        source_keys = converter.load_media_index(source, args.url_prefix)
+        print(f"{len(source_keys)} keys in '{source}'")
+        keys |= source_keys
+    keys.discard('')
+
+    temp_path = f"{args.output}.tmp"
+    with open(temp_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(f"{converter.MEDIA_INDEX_HEADER}: {len(keys)} keys\n")
+        for key in sorted(keys):
+            f.write(f"{key}\n")
+    os.replace(temp_path, args.output)
+    print(f"Wrote {len(keys)} keys to '{args.output}' in {time.perf_counter() - start_time:.2f}s.")
+
+if __name__ == "__main__":
+    main()
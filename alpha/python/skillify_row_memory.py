@@ -0,0 +1,93 @@
+################################################################################################################################
+# Memory used by the converted rows of skillify_XML_to_learndash_CSV_v4.py, as plain dicts vs compact rows.
+# 1. Take the XML files of a folder, or generate a synthetic export (skillify_synthetic_export.py) when none is given.
+# 2. Convert them twice in this process under tracemalloc, once into plain lists of dicts and once into the
+#    CompactRowList collections the converter uses by default. The HTML cache is off, so the rows own their values.
+# 3. The memory held by the rows is the traced memory released when the collections are dropped.
+#
+# Usage: python skillify_row_memory.py [xml_directory] [--scale N]
+################################################################################################################################
+
+import os
+import gc
+import sys
+import shutil
+import tempfile
+import argparse
+import tracemalloc
+import contextlib
+
+import skillify_XML_to_learndash_CSV_v4 as converter
+import skillify_synthetic_export
+
+################################################################################################################################
+
+def convert_rows(xml_paths, output_dir, compact):
+    data_collections = converter.create_data_collections()
+    if not compact:
+        data_collections = {name: [] for name in converter.ENTITY_NAMES}
+    fieldnames = {name: set() for name in converter.ENTITY_NAMES}
+    # process_course prints every skipped topic
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for xml_path in xml_paths:
+            converter.process_xml_file(xml_path, data_collections, fieldnames, output_dir)
+    return data_collections
+
+def measure_rows(xml_paths, output_dir, compact):
+    # Returns (bytes held by the row collections, number of rows)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        data_collections = convert_rows(xml_paths, output_dir, compact)
+        row_count = sum(len(data_list) for data_list in data_collections.values())
+        gc.collect()
+        with_rows, _ = tracemalloc.get_traced_memory()
+        del data_collections
+        gc.collect()
+        without_rows, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return with_rows - without_rows, row_count
+
+################################################################################################################################
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Measure the memory held by converted rows as dicts and as compact rows.")
+    parser.add_argument('directory', nargs='?', help="Directory of Skillify XML exports (a synthetic export is generated if omitted).")
+    parser.add_argument('--scale', type=int, default=10, metavar='N',
+                        help="Size of the synthetic export relative to the generator defaults (default: 10).")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    work_dir = tempfile.mkdtemp(prefix='skillify_row_memory_')
+    try:
+        xml_dir = args.directory
+        if not xml_dir:
+            xml_dir = os.path.join(work_dir, 'xml')
+            skillify_synthetic_export.generate_export(xml_dir, courses=5 * args.scale, xml_files=2 * args.scale)
+        elif not os.path.isdir(xml_dir):
+            print(f"The directory '{xml_dir}' does not exist.")
+            sys.exit(1)
+        xml_paths = sorted(os.path.join(xml_dir, f) for f in os.listdir(xml_dir) if f.lower().endswith('.xml'))
+
+        converter.configure_html_cache(0)
+        converter.configure_image_writer(0)
+        # Extracted images go to the work directory; a first pass fills the image memo for both measurements
+        output_dir = os.path.join(work_dir, 'output')
+        os.makedirs(output_dir)
+        convert_rows(xml_paths, output_dir, compact=True)
+
+        dict_bytes, row_count = measure_rows(xml_paths, output_dir, compact=False)
+        compact_bytes, _ = measure_rows(xml_paths, output_dir, compact=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{row_count} rows from {len(xml_paths)} XML files")
+    print(f"dict rows:    {dict_bytes / 1024 / 1024:8.2f} MB ({dict_bytes / max(row_count, 1):.0f} bytes per row)")
+    print(f"compact rows: {compact_bytes / 1024 / 1024:8.2f} MB ({compact_bytes / max(row_count, 1):.0f} bytes per row)")
+    if dict_bytes:
+        print(f"Reduction: {(1 - compact_bytes / dict_bytes) * 100:.1f}%")
+
+if __name__ == "__main__":
+    main()
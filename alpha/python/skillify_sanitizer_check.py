@@ -0,0 +1,183 @@
+################################################################################################################################
+# Equivalence check and benchmark for the HTML sanitizer engines of skillify_XML_to_learndash_CSV_v4.py.
+# 1. Collect HTML values: the built-in golden cases plus every HTML value found in the XML files of a folder
+#    (normalized the way clean_value does before it sanitizes them).
+# 2. Run every value through the 'bleach' engine (the reference) and the 'single-pass' engine and report any
+#    value on which they disagree. The exit status is 1 when there is a mismatch. Inputs on which the engines
+#    are known to differ (KNOWN_DIVERGENCES) are checked against the expected output of each engine instead.
+# 3. Check how ContentType "0" topic bodies are assembled from a description and its download list, with each
+#    engine (BODY_ASSEMBLY_CASES).
+# 4. Time both engines over the same values and print the speedup.
+#
+# Usage: python skillify_sanitizer_check.py [xml_directory] [--rounds N] [--show N]
+################################################################################################################################
+
+import os
+import sys
+import html
+import time
+import argparse
+
+from lxml import etree as ET
+
+import skillify_XML_to_learndash_CSV_v4 as converter
+
+################################################################################################################################
+
+# Markup patterns seen in Skillify descriptions, plus the parser corner cases the single-pass engine has to mirror
+GOLDEN_CASES = [
+    '<p>Plain paragraph</p>',
+    '<div>Converted <b>div</b></div><div></div>',
+    '<p class="MsoNormal"><span style="font-size:11pt"><font face="Calibri">Word text</font></span><o:p></o:p></p>',
+    '<p>&nbsp;</p><p>After an empty paragraph</p>',
+    '<p style="margin:0">Line one<br>Line two<br/>Line three</p>',
+    '<p>a<br>b<br />c<br>d</p>',
+    '<ul><li>One<li>Two</ul><ol><li><p>Nested <em>list</em></p></li></ol>',
+    '<h2>Heading<h3>Sub heading</h3></h2>',
+    '<p>Text <strong>bold <em>both</strong> italic</em> plain</p>',
+    '<a href="javascript:alert(1)">bad link</a> <a href="https://skillify.com/x?a=1&amp;b=2" title="ok">good link</a>',
+    '<img src="images/course.png" alt="Course" style="width:100px"><img>',
+    '<table><tr><td>Cell one</td><td>Cell two</td></tr></table>',
+    '<pre>\ncode\n  indented</pre>',
+    '<script>var x = "<p>";</script><style>p { color: red; }</style>Visible',
+    '<!-- comment --><p>After <!-- inline --> comment</p>',
+    '<blockquote><p>Quote</p></blockquote><figure><img src="a.png"><figcaption>Caption</figcaption></figure>',
+    '<p>Entities &amp; &lt;tags&gt; &quot;quotes&quot;</p>',
+    '<p class="  Mso  Normal ">Classes</p><p id="intro">Ids</p>',
+    '<div><hr></div><p>Rule<hr>after</p>',
+    '<p><img src="a.png">&nbsp;</img>after image</p>',
+]
+
+# ContentType "0" topic bodies: (raw description, download list HTML, expected body). The description and the
+# download list are sanitized separately and then joined, so an escaped '<' in the description stays text and
+# can't swallow the list, and entities are unescaped only the two times clean_value does it. Before the
+# description was cleaned again together with the list, so the first case lost the '&lt;x' and the <ul>, and the
+# second case turned '&lt;b&gt;' into a tag that was stripped.
+DOWNLOAD_LIST_HTML = '<ul><li><a href="f.pdf">f.pdf</a></li></ul>'
+BODY_ASSEMBLY_CASES = [
+    ('&lt;x', DOWNLOAD_LIST_HTML, '&lt;x' + DOWNLOAD_LIST_HTML),
+    ('Intro &amp;amp;lt;b&amp;amp;gt;bold', DOWNLOAD_LIST_HTML, 'Intro &lt;b&gt;bold' + DOWNLOAD_LIST_HTML),
+]
+
+# Inputs on which the engines are known to differ: (input, bleach output, single-pass output). bleach writes
+# <script>/<style> text back unescaped and the re-parse reads a '<' in it as a tag; single-pass keeps it as text.
+KNOWN_DIVERGENCES = [
+    ('<script>if(a<b){}</script><p>x</p>', 'if(a<p>x</p>', 'if(a&lt;b){}<p>x</p>'),
+    ('<style>p{a<b}</style><p>t</p>', 'p{a<p>t</p>', 'p{a&lt;b}<p>t</p>'),
+]
+
+def normalize_html_value(value):
+    # Same preparation as clean_value before it calls clean_html_content
+    value = html.unescape(html.unescape(value))
+    return ' '.join(value.split())
+
+def collect_html_values(directory):
+    values = []
+    seen = set()
+    xml_files = sorted(f for f in os.listdir(directory) if f.lower().endswith('.xml'))
+    for xml_file in xml_files:
+        for _, elem in ET.iterparse(os.path.join(directory, xml_file), huge_tree=True):
+            for raw in [elem.text] + list(elem.attrib.values()):
+                if not raw:
+                    continue
+                value = normalize_html_value(raw)
+                if "<" in value and ">" in value and value not in seen:
+                    seen.add(value)
+                    values.append(value)
+    return values
+
+################################################################################################################################
+
+def compare_engines(values, show):
+    reference = converter.HTML_SANITIZER_ENGINES['bleach']
+    candidate = converter.HTML_SANITIZER_ENGINES['single-pass']
+    mismatches = 0
+    for value in values:
+        expected = reference(value)
+        actual = candidate(value)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= show:
+                print(f"Mismatch for: {value!r}")
+                print(f"  bleach:      {expected!r}")
+                print(f"  single-pass: {actual!r}")
+    return mismatches
+
+def check_known_divergences(show):
+    failures = 0
+    for value, *expected_outputs in KNOWN_DIVERGENCES:
+        for engine, expected in zip(('bleach', 'single-pass'), expected_outputs):
+            actual = converter.HTML_SANITIZER_ENGINES[engine](value)
+            if actual != expected:
+                failures += 1
+                if failures <= show:
+                    print(f"Known divergence changed ({engine}) for: {value!r}")
+                    print(f"  expected: {expected!r}")
+                    print(f"  actual:   {actual!r}")
+    return failures
+
+def check_body_assembly(show):
+    failures = 0
+    for engine in ('bleach', 'single-pass'):
+        converter.set_html_sanitizer(engine)
+        for description, downloads_html, expected in BODY_ASSEMBLY_CASES:
+            actual = converter.join_sanitized_html(converter.clean_value(description), downloads_html)
+            if actual != expected:
+                failures += 1
+                if failures <= show:
+                    print(f"Body assembly mismatch ({engine}) for: {description!r}")
+                    print(f"  expected: {expected!r}")
+                    print(f"  actual:   {actual!r}")
+    converter.set_html_sanitizer('bleach')
+    return failures
+
+def time_engine(engine, values, rounds):
+    sanitize = converter.HTML_SANITIZER_ENGINES[engine]
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for value in values:
+            sanitize(value)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+################################################################################################################################
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Check that the single-pass HTML sanitizer matches the bleach pipeline and compare their speed.")
+    parser.add_argument('directory', nargs='?', help="Directory of Skillify XML exports to take HTML values from.")
+    parser.add_argument('--rounds', type=int, default=3, metavar='N',
+                        help="Timing rounds per engine; the fastest round is reported (default: 3).")
+    parser.add_argument('--show', type=int, default=10, metavar='N',
+                        help="Number of mismatches to print (default: 10).")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    values = list(GOLDEN_CASES)
+    if args.directory:
+        if not os.path.isdir(args.directory):
+            print(f"The directory '{args.directory}' does not exist.")
+            sys.exit(1)
+        values += collect_html_values(args.directory)
+    print(f"Checking {len(values)} HTML values ({len(GOLDEN_CASES)} built-in).")
+
+    mismatches = compare_engines(values, args.show)
+    print(f"{mismatches} mismatches.")
+    divergence_failures = check_known_divergences(args.show)
+    print(f"{divergence_failures} known divergence failures ({len(KNOWN_DIVERGENCES)} cases).")
+    body_failures = check_body_assembly(args.show)
+    print(f"{body_failures} body assembly failures ({len(BODY_ASSEMBLY_CASES)} cases per engine).")
+
+    bleach_seconds = time_engine('bleach', values, args.rounds)
+    single_pass_seconds = time_engine('single-pass', values, args.rounds)
+    for engine, seconds in (('bleach', bleach_seconds), ('single-pass', single_pass_seconds)):
+        print(f"{engine:12} {seconds:.3f}s ({seconds / len(values) * 1e6:.0f} us per value)")
+    if single_pass_seconds:
+        print(f"Speedup: {bleach_seconds / single_pass_seconds:.1f}x")
+
+    sys.exit(1 if mismatches or divergence_failures or body_failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+################################################################################################################################
+# Synthetic Skillify export generator.
+# Writes <Courses> XML files with the same shape as the real Skillify exports, so the XML -> LearnDash CSV converters
+# can be profiled and compared without sharing customer data.
+# 1. Every course gets the usual child elements, experts and an outline of Lessons -> Sections -> Content -> File.
+# 2. Content elements cycle through every Type/ContentType combination that process_course handles (plus a few it
+#    skips), Files sit directly in Sections and deeper than Content to hit every topic level.
+# 3. Descriptions and bios use Word-style HTML (MsoNormal paragraphs, <o:p>, <font>, inline styles, conditional
+#    comments), scripts, empty paragraphs and embedded base64 images, some repeated and some unique.
+# 4. Text is HTML-escaped before it is written to the XML, as in the real exports, which the converters unescape twice.
+#
+# Usage: python skillify_synthetic_export.py OUTPUT_DIR [--scale N] [--courses N] [--lessons N] [--sections N]
+#                                                       [--contents N] [--xml-files N] [--seed N]
+################################################################################################################################
+
+import os
+import html
+import zlib
+import struct
+import base64
+import random
+import argparse
+
+from lxml import etree as ET
+
+################################################################################################################################
+
+# (Type, ContentType) pairs of <Content> elements. The first block is handled by process_course, the rest are
+# unsupported combinations that the converters skip.
+CONTENT_TYPES = [
+    ('1', '0'),   # Download page
+    ('1', '1'),   # Audio page
+    ('1', '2'),   # Image page
+    ('1', '3'),   # Video page
+    ('1', '5'),   # Slide page
+    ('1', '6'),   # PDF page
+    ('1', '11'),  # TXT page
+    ('1', '16'),  # Multi-video page
+    ('1', '20'),  # Activity page
+    ('1', '22'),  # Code Activity page
+    ('2', '2'),   # Single question - drag matching
+    ('2', '4'),   # Single question - multiple choice
+    ('2', '5'),   # Single question - multiple selection
+    ('2', '7'),   # Single question - true/false
+    ('3', '1'),   # Test launch page
+    ('2', '9'),
+    ('1', '99'),
+    ('9', '9'),
+]
+
+VIDEO_NAMES = ['Video Training', 'Introduction', 'Working with Tables', '']
+FILE_NAMES = ['Clip1', 'Part2', 'Overview of the ribbon', 'Summary', '']
+
+def make_png(width, height, seed):
+    # Small valid PNG with a seed-dependent colour gradient
+    rows = b''.join(
+        b'\x00' + bytes((x * 7 + y * 3 + seed) % 256 for x in range(width) for _ in range(3))
+        for y in range(height)
+    )
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+
+# A few images shared by many descriptions (logos, icons) plus a pool that makes most embedded images unique
+SHARED_IMAGES = [base64.b64encode(make_png(32, 32, seed)).decode('ascii') for seed in range(3)]
+
+def word_paragraph(rng, text):
+    style = rng.choice(['margin-bottom:0in', 'mso-margin-top-alt:auto', 'line-height:115%'])
+    return (f'<p class="MsoNormal" style="{style}"><span style="font-size:11.0pt;font-family:&quot;Calibri&quot;,sans-serif;'
+            f'mso-fareast-font-family:&quot;Times New Roman&quot;">{text}</span><o:p></o:p></p>')
+
+def random_html(rng, unique_images):
+    # Builds a description out of the markup patterns found in Skillify exports
+    words = ['Select', 'the', '<b>Home</b>', 'tab', 'and', 'click', '<i>Format</i>', 'Painter', '&amp;', 'then', 'drag',
+             'across', 'the', 'cells', '&nbsp;', 'you', 'want', 'to', 'change.']
+    parts = []
+    for _ in range(rng.randint(1, 4)):
+        kind = rng.random()
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(4, 14)))
+        if kind < .35:
+            parts.append(word_paragraph(rng, text))
+        elif kind < .5:
+            parts.append(f'<div style="color:#333333"><font face="Arial" size="2">{text}</font></div><div>&nbsp;</div>')
+        elif kind < .6:
+            items = ''.join(f'<li><span>{rng.choice(words)} {rng.choice(words)}</span></li>' for _ in range(rng.randint(1, 4)))
+            parts.append(f'<ul style="margin-top:0in">{items}<li></li></ul>')
+        elif kind < .7:
+            parts.append(f'<p>{text} <a href="https://www.example.com/help?topic={rng.randint(1, 99)}&amp;lang=en" '
+                         f'onclick="track()">More information</a></p><p></p>')
+        elif kind < .77:
+            parts.append(f'<!--[if gte mso 9]><xml><o:OfficeDocumentSettings></o:OfficeDocumentSettings></xml><![endif]-->'
+                         f'<h2 style="mso-outline-level:2">{text}</h2>')
+        elif kind < .82:
+            parts.append(f'<p>{text}</p><script type="text/javascript">trackView();</script><style>p {{ color: red; }}</style>')
+        elif kind < .9:
+            data = rng.choice(SHARED_IMAGES)
+            parts.append(f'<p>{text}<br><img src="data:image/png;base64,{data}" alt="icon" style="width:32px"></p>')
+        elif unique_images:
+            data = base64.b64encode(make_png(48, 24, rng.randint(0, 10 ** 6))).decode('ascii')
+            parts.append(f'<p><img src="data:image/png;base64,{data}" alt="screenshot"><br/>{text}</p>')
+        else:
+            parts.append(f'<p>{text}</p>')
+    return ''.join(parts)
+
+def escaped(value):
+    # The exports store HTML-escaped text inside the XML, which lxml escapes once more when it is written
+    return html.escape(str(value), quote=False)
+
+def add_text_element(parent, tag, value):
+    element = ET.SubElement(parent, tag)
+    element.text = escaped(value)
+    return element
+
+def add_element(parent, tag, attributes):
+    return ET.SubElement(parent, tag, {name: escaped(value) for name, value in attributes.items()})
+
+################################################################################################################################
+
+def add_file(rng, parent, file_id, display_order, content_type):
+    attributes = {
+        'Id': file_id,
+        'Name': rng.choice(FILE_NAMES),
+        'Url': f"https://media.example.com/{file_id}.{'mp4' if content_type in ('3', '16') else 'pdf'}",
+        'DisplayOrder': display_order,
+        'Time': rng.randint(30, 900),
+        'Guid': f"{rng.getrandbits(64):016x}",
+        'SizeKb': rng.randint(10, 50000),
+    }
+    if rng.random() < .6:
+        attributes['Description'] = random_html(rng, unique_images=rng.random() < .3)
+    file_elem = add_element(parent, 'File', attributes)
+    if content_type in ('3', '16') and rng.random() < .6:
+        add_element(file_elem, 'Track', {
+            'MediaId': file_id, 'Label': 'English', 'Name': f"track{file_id}",
+            'Url': f"https://media.example.com/{file_id}.vtt",
+        })
+    return file_elem
+
+def add_content(rng, section_elem, content_index, next_id):
+    content_type, content_subtype = CONTENT_TYPES[content_index % len(CONTENT_TYPES)]
+    content_elem = add_element(section_elem, 'Content', {
+        'Id': next_id(), 'Type': content_type, 'ContentType': content_subtype,
+        'Name': rng.choice(VIDEO_NAMES) if content_subtype == '16' else f"Page {content_index + 1}",
+        'Take': 1, 'HasBookmark': 0, 'DisplayOrder': content_index + 1,
+    })
+    if content_type == '3':
+        add_element(content_elem, 'Settings', {
+            'EnableRetakes': 1, 'ForcePassTest': 0, 'TakeInOrder': 1, 'IsTimed': rng.randint(0, 1),
+            'DefaultTime': 3600, 'ShowFeedback': 1, 'Retakes': 3, 'IsPooling': 0,
+        })
+    file_count = rng.randint(2, 6) if content_subtype == '16' else 1
+    for file_index in range(file_count):
+        add_file(rng, content_elem, next_id(), file_index + 1, content_subtype)
+    if content_type == '1' and content_subtype == '0':
+        for download_index in range(rng.randint(0, 3)):
+            add_element(content_elem, 'Download', {
+                'Id': next_id(), 'Name': f"worksheet{download_index}",
+                'Title': f"Exercise file {download_index + 1}",
+                'Url': f"https://media.example.com/downloads/worksheet{download_index}.{rng.choice(['pdf', 'zip', 'xlsx'])}",
+                'SizeKb': rng.randint(5, 5000),
+            })
+    if rng.random() < .05:
+        # A File nested below an extra wrapper element (topic level 2)
+        wrapper = ET.SubElement(content_elem, 'Group')
+        add_file(rng, wrapper, next_id(), 1, content_subtype)
+
+def add_course(rng, courses_elem, course_id, lessons, sections, contents, next_id):
+    course_elem = ET.SubElement(courses_elem, 'Course')
+    add_text_element(course_elem, 'CourseId', course_id)
+    add_text_element(course_elem, 'RN', f"RN{course_id}")
+    add_text_element(course_elem, 'CourseName', f"Microsoft Office Course {course_id}")
+    add_text_element(course_elem, 'CourseSummary', random_html(rng, unique_images=False))
+    add_text_element(course_elem, 'Video', f"https://media.example.com/promo/{course_id}.mp4")
+    add_text_element(course_elem, 'Image', f"https://cdn.example.com/images/course{course_id}.jpg/")
+    add_text_element(course_elem, 'Duration', f"{rng.randint(1, 40)}:00:00")
+    add_text_element(course_elem, 'CategoryName', rng.choice(['Office', 'Networking', 'Design', 'Programming']))
+    add_text_element(course_elem, 'Level', rng.choice(['Beginner', 'Intermediate', 'Advanced']))
+    add_text_element(course_elem, 'Language', 'English')
+    add_text_element(course_elem, 'Price', f"{rng.randint(0, 500)}.00")
+    add_text_element(course_elem, 'ProductId', rng.randint(1000, 9999))
+
+    experts_elem = ET.SubElement(course_elem, 'Experts')
+    for expert_index in range(rng.randint(1, 3)):
+        expert_elem = ET.SubElement(experts_elem, 'Expert')
+        add_text_element(expert_elem, 'FirstName', rng.choice(['Ann', 'Ben', 'Carla', 'Dev']))
+        add_text_element(expert_elem, 'LastName', rng.choice(['Lee', 'Ng', 'Smith', 'Okafor']))
+        add_text_element(expert_elem, 'Title', 'Instructor')
+        add_text_element(expert_elem, 'Bio', random_html(rng, unique_images=False))
+
+    lessons_elem = ET.SubElement(ET.SubElement(course_elem, 'Outline'), 'Lessons')
+    content_index = course_id
+    for lesson_index in range(lessons):
+        lesson_elem = add_element(lessons_elem, 'Lesson', {
+            'Id': next_id(), 'Name': f"Lesson {lesson_index + 1}", 'DisplayOrder': lesson_index + 1,
+        })
+        for section_index in range(sections):
+            section_elem = add_element(lesson_elem, 'Section', {
+                'Id': next_id(), 'Type': 4, 'ContentType': 1, 'Name': f"Section {section_index + 1}",
+                'Pass': 70, 'Take': 1, 'HasBookmark': 0, 'DisplayOrder': section_index + 1,
+            })
+            if rng.random() < .1:
+                # A File placed directly in a Section (topic level 0)
+                add_file(rng, section_elem, next_id(), 0, '1')
+            for _ in range(contents):
+                add_content(rng, section_elem, content_index, next_id)
+                content_index += 1
+
+def generate_export(output_dir, courses=5, lessons=3, sections=3, contents=6, xml_files=2, seed=1):
+    # Writes xml_files files with `courses` courses spread over them; returns the paths of the files
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    counter = {'id': 0}
+    def next_id():
+        counter['id'] += 1
+        return counter['id']
+
+    paths = []
+    xml_files = max(1, min(xml_files, courses))
+    for file_index in range(xml_files):
+        courses_elem = ET.Element('Courses')
+        for course_number in range(file_index, courses, xml_files):
+            add_course(rng, courses_elem, 1001 + course_number, lessons, sections, contents, next_id)
+        path = os.path.join(output_dir, f"synthetic_export_{file_index + 1:03d}.xml")
+        ET.ElementTree(courses_elem).write(path, encoding='utf-8', xml_declaration=True, pretty_print=True)
+        paths.append(path)
+    return paths
+
+################################################################################################################################
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Generate synthetic Skillify <Courses> XML exports.")
+    parser.add_argument('output_dir', help="Directory the XML files are written to.")
+    parser.add_argument('--scale', type=int, default=1, metavar='N',
+                        help="Multiply the number of courses and XML files by N (default: 1).")
+    parser.add_argument('--courses', type=int, default=5, metavar='N', help="Courses at scale 1 (default: 5).")
+    parser.add_argument('--lessons', type=int, default=3, metavar='N', help="Lessons per course (default: 3).")
+    parser.add_argument('--sections', type=int, default=3, metavar='N', help="Sections per lesson (default: 3).")
+    parser.add_argument('--contents', type=int, default=6, metavar='N', help="Content elements per section (default: 6).")
+    parser.add_argument('--xml-files', type=int, default=2, metavar='N', help="XML files at scale 1 (default: 2).")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed (default: 1).")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    paths = generate_export(args.output_dir, courses=args.courses * args.scale, lessons=args.lessons,
+                            sections=args.sections, contents=args.contents, xml_files=args.xml_files * args.scale,
+                            seed=args.seed)
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    print(f"Wrote {len(paths)} XML files ({total_bytes / 1024 / 1024:.1f} MB) to '{args.output_dir}'.")
+
+if __name__ == "__main__":
+    main()